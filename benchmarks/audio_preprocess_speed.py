@@ -0,0 +1,39 @@
+"""Throughput of the server-side audio preprocessing stage, as a real-time factor on one core.
+
+Run from the repository root:  python -m benchmarks.audio_preprocess_speed [seconds]
+"""
+import sys
+import time
+
+import numpy as np
+
+from services.audio_preprocess import AudioPreprocessor
+
+CHUNK_SECONDS = 0.1  # Same 100 ms chunks as the capture thread
+
+def synthetic_pcm(rate, channels, seconds):
+    # Speech-band tone plus noise, interleaved 16-bit PCM
+    t = np.arange(int(rate * seconds)) / rate
+    signal = 0.2 * np.sin(2 * np.pi * 440 * t) + 0.02 * np.random.randn(len(t))
+    pcm = (signal * 32767).astype("<i2")
+    return np.repeat(pcm, channels).tobytes()
+
+def measure(rate, channels, seconds):
+    data = synthetic_pcm(rate, channels, seconds)
+    chunk_bytes = int(rate * CHUNK_SECONDS) * channels * 2
+    chunks = [data[i:i + chunk_bytes] for i in range(0, len(data), chunk_bytes)]
+    preprocessor = AudioPreprocessor(rate, channels)
+
+    start = time.perf_counter()
+    for chunk in chunks:
+        preprocessor.process(chunk)
+    elapsed = time.perf_counter() - start
+
+    per_chunk_us = elapsed / len(chunks) * 1e6
+    print(f"{rate:>6} Hz x{channels}  {per_chunk_us:8.1f} us/chunk   {seconds / elapsed:8.0f}x real time")
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 60
+    print(f"Processing {seconds:g} s of audio in {CHUNK_SECONDS * 1000:.0f} ms chunks")
+    for rate, channels in ((48000, 2), (44100, 2), (48000, 1), (16000, 1)):
+        measure(rate, channels, seconds)
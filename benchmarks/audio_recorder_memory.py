@@ -0,0 +1,56 @@
+"""Peak memory of an hour-long recording: buffered list + join vs. streaming WAV writes.
+
+Run from the repository root:  python -m benchmarks.audio_recorder_memory [minutes]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+
+from services.audio_recorder import CHUNK, CHANNELS, RATE, record_from_stream
+
+class SyntheticStream:
+    """Stands in for a PyAudio input stream, returning a fresh buffer per read like the real one."""
+
+    def read(self, frames):
+        return os.urandom(frames * CHANNELS * 2)
+
+def buffered_recording(path, duration):
+    # The previous record_audio: keep every chunk, then join them at the end
+    stream = SyntheticStream()
+    frames = []
+    for _ in range(0, int(RATE / CHUNK * duration)):
+        frames.append(stream.read(CHUNK))
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(CHANNELS)
+        wf.setsampwidth(2)
+        wf.setframerate(RATE)
+        wf.writeframes(b"".join(frames))
+
+def streaming_recording(path, duration):
+    record_from_stream(SyntheticStream(), path, duration=duration)
+
+def rolling_recording(path, duration):
+    record_from_stream(SyntheticStream(), path, duration=duration, window_seconds=300)
+
+def measure(name, fn, path, duration):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(path, duration)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<22} peak {peak / 1e6:9.2f} MB   {elapsed:6.2f}s   file {os.path.getsize(path) / 1e6:8.1f} MB")
+    os.remove(path)
+
+if __name__ == "__main__":
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 60
+    duration = minutes * 60
+    print(f"Recording {minutes:g} minutes of {RATE} Hz mono 16-bit audio")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "benchmark.wav")
+        measure("buffered (list+join)", buffered_recording, path, duration)
+        measure("streaming", streaming_recording, path, duration)
+        measure("rolling 5 min window", rolling_recording, path, duration)
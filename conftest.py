@@ -0,0 +1 @@
+# Lets the tests import the app packages (routes, services) from the repository root
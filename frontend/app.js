@@ -12,6 +12,7 @@ let isRecording = false;
 let sessionStartTime; // To track when recording session started
 let savedFilePath = null; // Track the saved file path
 let stopCommandSent = false; // Flag to track if stop command was sent
+let deltaDecoder = new DeltaDecoder(); // Rebuilds messages sent on the compact binary protocol
 
 document.getElementById("record-btn").addEventListener("click", function () {
     console.log("Record button clicked.");
@@ -53,9 +54,11 @@ async function startRecordingAndTranscribing() {
         // Disable TTS button until we have a translation
         document.getElementById("audio-btn").disabled = true;
         
-        // Establish WebSocket connection - Add language parameter
-        const wsUrl = `ws://127.0.0.1:8000/record_and_transcribe?language=${selectedLanguage}`;
+        // Establish WebSocket connection - Add language parameter and ask for the compact delta protocol
+        const wsUrl = `ws://127.0.0.1:8000/record_and_transcribe?language=${selectedLanguage}&protocol=delta`;
         socket = new WebSocket(wsUrl);
+        socket.binaryType = "arraybuffer";
+        deltaDecoder.reset();
         console.log(`Creating WebSocket connection to ${wsUrl}...`);
 
         socket.onopen = async () => {
@@ -131,11 +134,14 @@ async function startRecordingAndTranscribing() {
         socket.onmessage = async (event) => {
             console.log("Received message from server:", event.data);
             try {
-                const data = JSON.parse(event.data);
+                // Text frames are JSON; binary frames use the negotiated delta protocol
+                const data = typeof event.data === "string"
+                    ? JSON.parse(event.data)
+                    : deltaDecoder.decode(event.data);
                 
                 // If we got a connection confirmation
                 if (data.status === "connected") {
-                    console.log("Connection confirmed with ID:", data.connection_id);
+                    console.log("Connection confirmed with ID:", data.connection_id, "Protocol:", data.protocol);
                 }
                 
                 // Process real-time original transcription
@@ -177,6 +183,12 @@ async function startRecordingAndTranscribing() {
                     }
                 }
                 
+                // Server is restarting - the session will end at the deadline
+                if (data.status === "DRAINING") {
+                    console.log("Server draining, seconds remaining:", data.seconds_remaining);
+                    statusText.innerText = "Server restarting - please finish the current sentence";
+                }
+                
                 // Handle error messages
                 if (data.error) {
                     console.error("Server error:", data.error);
@@ -304,19 +316,6 @@ function resetRecordButton() {
     document.getElementById("record-btn").innerText = "Start Recording";
 }
 
-console.log("Attempting to free port 8000 before sending TTS request...");
-
-async function killProcessOnPort() {
-    try {
-        const killResponse = await fetch("http://127.0.0.1:8000/api/kill_port/", { method: "POST" });
-        const killData = await killResponse.json();
-        console.log("Kill process response:", killData.message);
-    } catch (error) {
-        console.error("Error killing process:", error);
-    }
-}
-
-
 async function convertTextToSpeech() {
     const statusText = document.getElementById("status");
     statusText.innerText = "Converting to speech...";
@@ -347,7 +346,6 @@ async function convertTextToSpeech() {
     try {
         console.log("Sending TTS request...");
 
-        await killProcessOnPort(); 
         const response = await fetch("http://127.0.0.1:8000/api/tts/", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
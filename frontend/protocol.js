@@ -0,0 +1,106 @@
+// Decoder for the compact "delta-msgpack" WebSocket protocol.
+// Binary frames are msgpack maps with short keys; text fields arrive as
+// [replaceFromOffset, newText] deltas against the previous value of that field.
+
+const DELTA_FIELDS = { o: "original", t: "translation" };
+const SHORT_KEYS = { s: "status", f: "is_final" };
+
+const utf8Decoder = new TextDecoder("utf-8");
+
+// Minimal msgpack decoder covering the types the server sends
+function decodeMsgpack(buffer) {
+    const view = new DataView(buffer);
+    const bytes = new Uint8Array(buffer);
+    let pos = 0;
+
+    function readString(length) {
+        const value = utf8Decoder.decode(bytes.subarray(pos, pos + length));
+        pos += length;
+        return value;
+    }
+
+    function readArray(length) {
+        const result = new Array(length);
+        for (let i = 0; i < length; i++) {
+            result[i] = read();
+        }
+        return result;
+    }
+
+    function readMap(length) {
+        const result = {};
+        for (let i = 0; i < length; i++) {
+            const key = read();
+            result[key] = read();
+        }
+        return result;
+    }
+
+    function read() {
+        const type = bytes[pos++];
+
+        if (type <= 0x7f) return type;                       // positive fixint
+        if (type >= 0xe0) return type - 0x100;               // negative fixint
+        if (type >= 0x80 && type <= 0x8f) return readMap(type & 0x0f);
+        if (type >= 0x90 && type <= 0x9f) return readArray(type & 0x0f);
+        if (type >= 0xa0 && type <= 0xbf) return readString(type & 0x1f);
+
+        // Fixed-width types; bin types are never sent by the server
+        let value;
+        switch (type) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xca: value = view.getFloat32(pos); pos += 4; return value;
+            case 0xcb: value = view.getFloat64(pos); pos += 8; return value;
+            case 0xcc: value = view.getUint8(pos); pos += 1; return value;
+            case 0xcd: value = view.getUint16(pos); pos += 2; return value;
+            case 0xce: value = view.getUint32(pos); pos += 4; return value;
+            case 0xcf: value = Number(view.getBigUint64(pos)); pos += 8; return value;
+            case 0xd0: value = view.getInt8(pos); pos += 1; return value;
+            case 0xd1: value = view.getInt16(pos); pos += 2; return value;
+            case 0xd2: value = view.getInt32(pos); pos += 4; return value;
+            case 0xd3: value = Number(view.getBigInt64(pos)); pos += 8; return value;
+            case 0xd9: value = view.getUint8(pos); pos += 1; return readString(value);
+            case 0xda: value = view.getUint16(pos); pos += 2; return readString(value);
+            case 0xdb: value = view.getUint32(pos); pos += 4; return readString(value);
+            case 0xdc: value = view.getUint16(pos); pos += 2; return readArray(value);
+            case 0xdd: value = view.getUint32(pos); pos += 4; return readArray(value);
+            case 0xde: value = view.getUint16(pos); pos += 2; return readMap(value);
+            case 0xdf: value = view.getUint32(pos); pos += 4; return readMap(value);
+            default:
+                throw new Error("Unsupported msgpack type 0x" + type.toString(16));
+        }
+    }
+
+    return read();
+}
+
+// Rebuilds full messages (same shape as the JSON protocol) from delta frames
+class DeltaDecoder {
+    constructor() {
+        this.reset();
+    }
+
+    reset() {
+        this.current = { original: "", translation: "" };
+    }
+
+    decode(buffer) {
+        const frame = decodeMsgpack(buffer);
+        const message = {};
+
+        for (const [key, value] of Object.entries(frame)) {
+            if (key in DELTA_FIELDS) {
+                const field = DELTA_FIELDS[key];
+                const [offset, text] = value;
+                this.current[field] = this.current[field].slice(0, offset) + text;
+                message[field] = this.current[field];
+            } else {
+                message[SHORT_KEYS[key] || key] = value;
+            }
+        }
+
+        return message;
+    }
+}
@@ -1,7 +1,10 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
-from routes import speech, translation, tts
+from routes import speech, translation, tts, static_audio, server
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse
+from services.api_scheduler import api_scheduler
+from services.drain import drain_state
 import logging
 import os
 import uvicorn
@@ -30,24 +33,43 @@ app.add_middleware(
 # Set up storage paths - use /tmp for ephemeral storage on GCP
 static_dir = os.environ.get("STATIC_DIR", "/tmp/static")
 os.makedirs(static_dir, exist_ok=True)
+# Generated audio gets caching headers, range requests and variants; it must be registered before the mount
+app.include_router(static_audio.router)
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
 # Include routers for HTTP endpoints
 app.include_router(speech.router, prefix="/api")
 app.include_router(translation.router, prefix="/api")
 app.include_router(tts.router, prefix="/api")
+app.include_router(server.router, prefix="/api")
 
 # Import the WebSocket handler function from speech.py
 from routes.speech import websocket_endpoint as speech_websocket_endpoint
+from routes.speech import listener_endpoint as speech_listener_endpoint
 
 # Register the WebSocket endpoint directly on the main app
 @app.websocket("/record_and_transcribe")
 async def record_and_transcribe(
     websocket: WebSocket, 
-    language: Optional[str] = Query(None)
+    language: Optional[str] = Query(None),
+    protocol: Optional[str] = Query(None),
+    max_rate: Optional[float] = Query(None),
+    sample_rate: Optional[int] = Query(None),
+    channels: Optional[int] = Query(None)
 ):
     # Forward to the handler in speech.py
-    await speech_websocket_endpoint(websocket, language)
+    await speech_websocket_endpoint(websocket, language, protocol, max_rate, sample_rate, channels)
+
+# Listeners follow an existing speaker session, each in its own language
+@app.websocket("/listen/{session_id}")
+async def listen(
+    websocket: WebSocket,
+    session_id: str,
+    language: Optional[str] = Query(None),
+    protocol: Optional[str] = Query(None),
+    max_rate: Optional[float] = Query(None)
+):
+    await speech_listener_endpoint(websocket, session_id, language, protocol, max_rate)
 
 @app.get("/")
 def home():
@@ -56,8 +78,16 @@ def home():
 @app.get("/healthcheck")
 def healthcheck():
     """Endpoint for health checks"""
+    # Report unhealthy while draining so load balancers stop sending new sessions here
+    if drain_state.draining:
+        return JSONResponse(status_code=503, content={"status": "draining", "version": "1.0.0", "env": "gcp"})
     return {"status": "healthy", "version": "1.0.0", "env": "gcp"}
 
+@app.get("/metrics/scheduler")
+def scheduler_metrics():
+    """Queue wait times, retries and coalesced calls for the Google API scheduler"""
+    return api_scheduler.metrics()
+
 # Add startup and shutdown event handlers
 @app.on_event("startup")
 async def startup_event():
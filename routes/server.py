@@ -1,28 +1,61 @@
+import asyncio
+import hmac
 import os
-import signal
-import psutil
-from fastapi import FastAPI
-
-app = FastAPI()
-
-PORT = 8000  # Change this if using a different port
-
-def kill_process_using_port(port):
-    """Find and kill process using the given port."""
-    for proc in psutil.process_iter(['pid', 'name', 'connections']):
-        try:
-            for conn in proc.info['connections']:
-                if conn.laddr.port == port:
-                    print(f"Killing process {proc.info['name']} (PID: {proc.info['pid']}) using port {port}")
-                    os.kill(proc.info['pid'], signal.SIGKILL)
-                    return True
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            pass
-    return False
-
-@app.post("/kill_port/")
-async def kill_port():
-    """Kill the process using port 8000 before handling any requests."""
-    killed = kill_process_using_port(PORT)
-    return {"message": "Process killed" if killed else "No process found"}
+from fastapi import APIRouter, Depends, HTTPException, Request
+from routes.speech import active_connections
+from services.drain import drain, drain_state, find_own_listener_pid, DRAIN_TIMEOUT
 
+router = APIRouter()
+
+PORT = int(os.environ.get("PORT", 8080))  # Port this server listens on
+
+# Token required by the admin endpoints below; without one they only answer requests from this host
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+def require_admin(request: Request):
+    """Allow the request if it carries the admin token, or comes from localhost when no token is set."""
+    if ADMIN_TOKEN:
+        token = request.headers.get("x-admin-token", "")
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            raise HTTPException(status_code=403, detail="Admin token required")
+    elif request.client is None or request.client.host not in LOOPBACK_HOSTS:
+        raise HTTPException(status_code=403, detail="Only available from localhost unless ADMIN_TOKEN is set")
+
+def start_drain(timeout):
+    """Start draining this server in the background (idempotent)."""
+    # Set the flag now so new sessions are refused and the response carries the deadline
+    if not drain_state.draining:
+        drain_state.start(timeout)
+    if drain_state.task is None or drain_state.task.done():
+        drain_state.task = asyncio.create_task(drain(active_connections, timeout))
+    return drain_status_body("Draining")
+
+def drain_status_body(message=None):
+    body = {
+        "draining": drain_state.draining,
+        "active_sessions": len(active_connections),
+        "deadline": drain_state.deadline,  # Unix timestamp, as in the DRAINING WebSocket message
+        "seconds_remaining": drain_state.seconds_remaining()
+    }
+    if message:
+        body["message"] = message
+    return body
+
+@router.post("/drain/", dependencies=[Depends(require_admin)])
+async def start_draining(timeout: float = DRAIN_TIMEOUT):
+    """Stop accepting new sessions, let active ones finish within the deadline, then exit."""
+    return start_drain(timeout)
+
+@router.get("/drain/", dependencies=[Depends(require_admin)])
+async def drain_status():
+    return drain_status_body()
+
+@router.post("/kill_port/", dependencies=[Depends(require_admin)])
+async def kill_port(timeout: float = DRAIN_TIMEOUT):
+    """Free this server's own port by draining it. Other processes are never signalled."""
+    pid = await asyncio.to_thread(find_own_listener_pid, PORT)
+    if pid is None:
+        raise HTTPException(status_code=409, detail=f"This server is not listening on port {PORT}")
+    # Our own listener (or the uvicorn supervisor holding it) - drain instead of killing mid-session
+    return start_drain(timeout)
@@ -8,15 +8,27 @@ import uuid
 import os
 import queue
 import threading
+import time
 import pyaudio
 from typing import Optional
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, Body
+from fastapi.responses import Response
 from pydantic import BaseModel
 import json
 import os
 from datetime import datetime
 from typing import Optional, Dict, Any
 from fastapi import HTTPException
+from services.translation_memory import translation_memory
+from services.ws_protocol import MessageSender, negotiate_protocol, INTERIM_MAX_RATE
+from services.api_scheduler import api_scheduler, PRIORITY_HIGH, PRIORITY_LOW
+from services.transcript_store import transcript_store
+from services.interim_throttle import InterimTranslationThrottle
+from services.session_hub import SpeakerSession, speaker_sessions, localize
+from services.languages import language_key
+from services.drain import drain_state
+from services.audio_preprocess import AudioPreprocessor, SUPPORTED_RATES, MAX_CHANNELS
+from services import audio_archive
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -60,31 +72,103 @@ CHANNELS = 1
 # Active WebSockets and their stop events
 active_connections = {}
 
-# Function to translate text
-def translate_text(text, target_language):
+# Function to translate text. Returns None if the translation could not be obtained.
+def translate_text(text, target_language, remember=False, priority=PRIORITY_LOW):
     if not text or not text.strip():
         return ""
     
     # Extract language code from language-country format (e.g., "en-US" -> "en")
-    target_language_code = target_language.split('-')[0] if '-' in target_language else target_language
+    target_language_code = language_key(target_language)
+    
+    # Reuse the stored translation of this exact text before calling Google
+    if translation_memory:
+        stored = translation_memory.lookup(text, target_language_code)
+        if stored:
+            return stored
     
     try:
-        translation = translate_client.translate(
+        # Go through the shared scheduler so quota errors are retried instead of shown to patients
+        translation = api_scheduler.call(
+            "translate",
+            translate_client.translate,
             text,
-            target_language=target_language_code
+            target_language=target_language_code,
+            priority=priority,
+            coalesce_key=(target_language_code, text)
         )
+        # Only remember complete utterances so partial interim text does not pollute the memory
+        if remember and translation_memory:
+            translation_memory.record(text, target_language_code, translation['translatedText'])
         return translation['translatedText']
     except Exception as e:
         logger.error(f"Translation error: {e}")
-        return f"[Translation error: {str(e)}]"
+        return None
 
 # Process speech responses with better stop handling
-async def process_speech_responses(responses, send_message, stop_event, target_language):
-    last_transcript = ""
+async def process_speech_responses(responses, send_message, stop_event, target_languages, session_id=None, archive=None):
+    # A single language may be passed as a string; a list may grow while the session runs
+    if isinstance(target_languages, str):
+        target_languages = [target_languages]
     final_sent = False
+    latest_transcript = ""
+    loop = asyncio.get_running_loop()
+    response_queue = asyncio.Queue()
+    throttle = InterimTranslationThrottle()
+
+    # Pull responses on a dedicated thread so the blocking gRPC iterator never stalls the event loop
+    def read_responses():
+        try:
+            for response in responses:
+                loop.call_soon_threadsafe(response_queue.put_nowait, response)
+                if stop_event.is_set():
+                    break
+        except Exception as e:
+            loop.call_soon_threadsafe(response_queue.put_nowait, e)
+        finally:
+            try:
+                loop.call_soon_threadsafe(response_queue.put_nowait, None)
+            except RuntimeError:
+                # Event loop already closed
+                pass
+
+    # Translate into every target language concurrently; results are keyed by language
+    async def translate_all(text, remember, priority):
+        languages = list(target_languages)
+        results = await asyncio.gather(*(
+            asyncio.to_thread(translate_text, text, language, remember, priority)
+            for language in languages
+        ))
+        return dict(zip(languages, results))
+
+    # Translate interim transcripts as the throttle allows, one at a time
+    async def translate_interim():
+        while True:
+            text, generation = await throttle.next()
+            started = time.monotonic()
+            translations = await translate_all(text, False, PRIORITY_LOW)
+            throttle.record_latency(time.monotonic() - started)
+
+            # A FINAL result may have arrived meanwhile; its translation supersedes this one
+            if throttle.is_current(generation) and not stop_event.is_set():
+                await send_message({
+                    "status": "INTERIM",
+                    "original": latest_transcript,
+                    "translations": translations,
+                    "is_final": False
+                })
+
+    reader_thread = threading.Thread(target=read_responses, daemon=True)
+    reader_thread.start()
+    interim_task = asyncio.create_task(translate_interim())
     
     try:
-        for response in responses:
+        while True:
+            response = await response_queue.get()
+            if response is None:
+                break
+            if isinstance(response, Exception):
+                raise response
+
             if stop_event.is_set():
                 logger.info("Stop event detected during response processing")
                 break
@@ -96,71 +180,107 @@ async def process_speech_responses(responses, send_message, stop_event, target_l
             is_final = result.is_final
             transcript = result.alternatives[0].transcript
 
-            # Only translate final results or if transcript changed significantly
-            if is_final or (not is_final and abs(len(transcript) - len(last_transcript)) > 10):
-                translation = translate_text(transcript, target_language)
-                last_transcript = transcript
+            # Map the result to its position in the archived audio
+            if archive is not None and is_final and result.result_end_time:
+                archive.record_result(transcript, is_final, result.result_end_time.total_seconds())
+
+            if is_final:
+                # Drop queued interim work; the final translation replaces it
+                throttle.cancel()
+                latest_transcript = ""
+                translations = await translate_all(transcript, True, PRIORITY_HIGH)
 
-                status = "FINAL" if is_final else "INTERIM"
-                message = json.dumps({
-                    "status": status,
+                await send_message({
+                    "status": "FINAL",
                     "original": transcript,
-                    "translation": translation,
-                    "is_final": is_final
+                    "translations": translations,
+                    "is_final": True
                 })
-                await send_message(message)
+
+                # Keep FINAL segments in the session's transcript log for later retrieval and TTS
+                if session_id:
+                    for language, translation in translations.items():
+                        try:
+                            transcript_store.append(session_id, transcript, translation or "", language)
+                        except Exception as e:
+                            logger.error(f"Error appending to transcript store: {e}")
             else:
-                # Just update the transcript for interim results without translation
-                message = json.dumps({
+                # Show the transcript right away; its translation follows when the throttle allows
+                latest_transcript = transcript
+                await send_message({
                     "status": "INTERIM",
                     "original": transcript,
                     "is_final": False
                 })
-                await send_message(message)
+                throttle.submit(transcript)
         
         # Always send a final COMPLETE message when done (if not already stopped)
         if not stop_event.is_set() and not final_sent:
             logger.info("Sending COMPLETE message")
-            await send_message(json.dumps({
+            await send_message({
                 "status": "COMPLETE",
                 "is_final": True
-            }))
+            })
             final_sent = True
             
     except Exception as e:
         logger.error(f"Error in process_speech_responses: {str(e)}")
         if not stop_event.is_set() and not final_sent:
             try:
-                await send_message(json.dumps({
+                await send_message({
                     "status": "ERROR",
                     "error": str(e),
                     "is_final": True
-                }))
+                })
             except:
                 pass
     finally:
+        interim_task.cancel()
+
         # Ensure we always send a COMPLETE message if not already sent
         if not stop_event.is_set() and not final_sent:
             try:
                 logger.info("Sending final COMPLETE message from finally block")
-                await send_message(json.dumps({
+                await send_message({
                     "status": "COMPLETE",
                     "is_final": True
-                }))
+                })
             except:
                 pass
 
 @router.websocket("/record_and_transcribe")
 async def websocket_endpoint(
     websocket: WebSocket, 
-    language: Optional[str] = Query(None)
+    language: Optional[str] = Query(None),
+    protocol: Optional[str] = Query(None),
+    max_rate: Optional[float] = Query(None),
+    sample_rate: Optional[int] = Query(None),
+    channels: Optional[int] = Query(None)
 ):
     """WebSocket endpoint that processes audio sent from client and returns transcriptions."""
-    logger.info(f"WebSocket connection request received with language={language}")
+    logger.info(f"WebSocket connection request received with language={language}, protocol={protocol}")
     connection_id = str(uuid.uuid4())
 
     try:
         await websocket.accept()
+
+        # Refuse new sessions while draining so the client reconnects to another instance
+        if drain_state.draining:
+            logger.info(f"Refusing session {connection_id}: server is draining")
+            await websocket.send_text(json.dumps({"status": "ERROR", "error": "Server is restarting, please reconnect"}))
+            await websocket.close(code=1013)
+            return
+
+        # Only known capture formats; anything else could make the resampler allocate huge filters
+        if (sample_rate is not None and sample_rate not in SUPPORTED_RATES) or (channels is not None and not 1 <= channels <= MAX_CHANNELS):
+            logger.info(f"Refusing session {connection_id}: unsupported format sample_rate={sample_rate}, channels={channels}")
+            await websocket.send_text(json.dumps({
+                "status": "ERROR",
+                "error": f"Unsupported audio format: sample_rate must be one of {', '.join(map(str, SUPPORTED_RATES))} "
+                         f"and channels between 1 and {MAX_CHANNELS}"
+            }))
+            await websocket.close(code=1003)
+            return
         
         # Create stop event and store connection info
         stop_event = threading.Event()
@@ -171,15 +291,39 @@ async def websocket_endpoint(
         
         logger.info(f"WebSocket connection established: {connection_id}")
 
+        # Negotiate the result protocol - the connection message is always JSON so any client can read it
+        negotiated_protocol = negotiate_protocol(protocol)
+        sender = MessageSender(websocket, negotiated_protocol, max_rate if max_rate else INTERIM_MAX_RATE)
+
         # Send connection message
-        await websocket.send_text(json.dumps({"status": "connected", "connection_id": connection_id}))
+        await websocket.send_text(json.dumps({
+            "status": "connected",
+            "connection_id": connection_id,
+            "protocol": negotiated_protocol
+        }))
 
         # Create a thread-safe queue for audio data
         audio_queue = queue.Queue()
 
-        # Target language for translation - use the one provided in the query parameter or default to "en-US"
-        target_language = language if language else "en-US"
-        logger.info(f"Using target language: {target_language}")
+        # Target languages for translation - a comma-separated list in the query parameter, defaulting to "en-US".
+        # The first one is the speaker's own display language.
+        target_languages = parse_languages(language) or ["en-US"]
+        logger.info(f"Using target languages: {target_languages}")
+
+        # Register the session so listener WebSockets can subscribe to it
+        session = SpeakerSession(connection_id, target_languages)
+        speaker_sessions[connection_id] = session
+
+        # Capture format of the input device; anything other than mono 16 kHz is converted before recognition
+        input_rate = sample_rate if sample_rate else RATE
+        input_channels = channels if channels else CHANNELS
+        preprocessor = AudioPreprocessor(input_rate, input_channels)
+
+        # Optional archive of the recognition audio; the tap only enqueues, encoding happens off the hot path
+        archive = None
+        if audio_archive.AUDIO_ARCHIVE_ENABLED:
+            archive = audio_archive.SessionArchive(connection_id, bucket=audio_archive.archive_bucket)
+        input_chunk = int(input_rate / 10)  # 100ms chunks
 
         # Start the audio capture in a background thread
         def audio_capture_thread():
@@ -190,15 +334,15 @@ async def websocket_endpoint(
             try:
                 stream = p.open(
                     format=FORMAT,
-                    channels=CHANNELS,
-                    rate=RATE,
+                    channels=input_channels,
+                    rate=input_rate,
                     input=True,
-                    frames_per_buffer=CHUNK
+                    frames_per_buffer=input_chunk
                 )
 
                 while not stop_event.is_set():
                     try:
-                        data = stream.read(CHUNK, exception_on_overflow=False)
+                        data = stream.read(input_chunk, exception_on_overflow=False)
                         audio_queue.put(data)
                     except Exception as e:
                         logger.error(f"Error reading from audio stream: {e}")
@@ -246,7 +390,12 @@ async def websocket_endpoint(
                     try:
                         # Smaller timeout to be more responsive to stop events
                         chunk = audio_queue.get(block=True, timeout=0.3)
-                        yield speech.StreamingRecognizeRequest(audio_content=chunk)
+                        # Downmix, resample and normalize to the mono 16 kHz stream configured below
+                        chunk = preprocessor.process(chunk)
+                        if chunk:
+                            if archive is not None:
+                                archive.tap(chunk)
+                            yield speech.StreamingRecognizeRequest(audio_content=chunk)
                     except queue.Empty:
                         # No data available, check if we should stop
                         continue
@@ -257,11 +406,12 @@ async def websocket_endpoint(
             finally:
                 logger.info("Request generator ended")
 
-        # Function to send message to WebSocket
+        # Function to send message to WebSocket and to any listeners of this session
         async def send_message(msg):
             try:
+                await session.publish(msg)
                 if not stop_event.is_set():
-                    await websocket.send_text(msg)
+                    await sender.send(localize(msg, target_languages[0], include_all=len(target_languages) > 1))
                     return True
                 return False
             except Exception as e:
@@ -269,6 +419,9 @@ async def websocket_endpoint(
                 stop_event.set()
                 return False
 
+        # Let the drain facility reach this session
+        active_connections[connection_id]["send_message"] = send_message
+
         # Process WebSocket messages from client
         async def process_client_messages():
             try:
@@ -282,10 +435,10 @@ async def websocket_endpoint(
                                 logger.info(f"Received stop command from client: {connection_id}")
                                 stop_event.set()
                                 # Send acknowledgment back to client
-                                await send_message(json.dumps({
+                                await send_message({
                                     "status": "STOPPING",
                                     "message": "Stop command received"
-                                }))
+                                })
                                 break
                         except json.JSONDecodeError:
                             # Binary data (audio) - no action needed here
@@ -307,17 +460,27 @@ async def websocket_endpoint(
 
         # Start streaming recognition with the improved process_speech_responses function
         try:
-            logger.info(f"⚙️ Starting speech recognition with translation to {target_language}...")
+            logger.info(f"⚙️ Starting speech recognition with translation to {target_languages}...")
             requests = generate_requests()
-            responses = speech_client.streaming_recognize(streaming_config, requests)
+            # Opening a stream counts against the Speech quota; the stream itself cannot be retried.
+            # Waiting for quota blocks, so it happens on a worker thread rather than the event loop.
+            responses = await asyncio.to_thread(
+                api_scheduler.call,
+                "speech",
+                speech_client.streaming_recognize,
+                streaming_config,
+                requests,
+                priority=PRIORITY_HIGH,
+                retry=False
+            )
             
             # Process the responses using the improved function
-            await process_speech_responses(responses, send_message, stop_event, target_language)
+            await process_speech_responses(responses, send_message, stop_event, target_languages, connection_id, archive)
 
         except Exception as e:
             logger.error(f"Error in speech recognition or translation: {str(e)}")
             if not stop_event.is_set():
-                await send_message(json.dumps({"error": str(e)}))
+                await send_message({"error": str(e)})
         finally:
             stop_event.set()
             if not message_task.done():
@@ -329,10 +492,10 @@ async def websocket_endpoint(
             # Send a final message indicating completion if not already sent
             try:
                 if not stop_event.is_set():
-                    await send_message(json.dumps({
+                    await send_message({
                         "status": "COMPLETE",
                         "message": "Processing completed"
-                    }))
+                    })
             except:
                 pass
 
@@ -358,6 +521,26 @@ async def websocket_endpoint(
         # Clean up active connections
         if connection_id in active_connections:
             del active_connections[connection_id]
+
+        if 'sender' in locals():
+            sender.close()
+
+        # Flush any transcript segments still waiting for a batched upload
+        transcript_store.close(connection_id)
+
+        # Write out the last partial archive chunk without blocking the event loop
+        if 'archive' in locals() and archive is not None:
+            try:
+                await asyncio.to_thread(archive.close)
+            except Exception as e:
+                logger.error(f"Error closing audio archive for {connection_id}: {e}")
+
+        # Let listeners know the speaker is done
+        if connection_id in speaker_sessions:
+            try:
+                await speaker_sessions.pop(connection_id).close()
+            except Exception as e:
+                logger.error(f"Error closing listeners for {connection_id}: {e}")
         
         # Ensure stream and PyAudio are cleaned up (redundant but safe)
         if 'p' in locals():
@@ -375,6 +558,102 @@ async def websocket_endpoint(
                 
         logger.info(f"Connection closed and cleaned up: {connection_id}")
 
+@router.websocket("/listen/{session_id}")
+async def listener_endpoint(
+    websocket: WebSocket,
+    session_id: str,
+    language: Optional[str] = Query(None),
+    protocol: Optional[str] = Query(None),
+    max_rate: Optional[float] = Query(None)
+):
+    """WebSocket endpoint that follows another connection's session, translated into its own language."""
+    await websocket.accept()
+
+    session = speaker_sessions.get(session_id)
+    if session is None:
+        await websocket.send_text(json.dumps({"status": "ERROR", "error": f"No active session: {session_id}"}))
+        await websocket.close(code=4404)
+        return
+
+    # A language the session already translates into (by base code) is shared rather than added twice
+    listener_language = session.resolve_language(language or session.languages[0])
+    negotiated_protocol = negotiate_protocol(protocol)
+    sender = MessageSender(websocket, negotiated_protocol, max_rate if max_rate else INTERIM_MAX_RATE)
+    await websocket.send_text(json.dumps({
+        "status": "connected",
+        "session_id": session_id,
+        "language": listener_language,
+        "protocol": negotiated_protocol
+    }))
+
+    listener_id, listener_language = session.add_listener(listener_language, sender)
+    logger.info(f"Listener {listener_id} joined session {session_id} with language {listener_language}")
+
+    # Wait until the client disconnects or the speaker's session ends
+    receive_task = asyncio.create_task(websocket.receive())
+    closed_task = asyncio.create_task(session.closed.wait())
+    try:
+        while True:
+            done, _ = await asyncio.wait({receive_task, closed_task}, return_when=asyncio.FIRST_COMPLETED)
+            if closed_task in done or receive_task.result()["type"] == "websocket.disconnect":
+                break
+            receive_task = asyncio.create_task(websocket.receive())
+    except Exception as e:
+        logger.info(f"Listener {listener_id} ended: {e}")
+    finally:
+        for task in (receive_task, closed_task):
+            if not task.done():
+                task.cancel()
+        session.remove_listener(listener_id)
+        sender.close()
+        if session.closed.is_set():
+            try:
+                await websocket.close()
+            except:
+                pass
+        logger.info(f"Listener {listener_id} left session {session_id}")
+
+# Archived session audio: the index of chunks and results, and replay of any time range
+@router.get("/archive/{session_id}")
+async def get_archive_index(session_id: str):
+    try:
+        entries = await asyncio.to_thread(audio_archive.read_index, session_id, bucket=audio_archive.archive_bucket)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not entries:
+        raise HTTPException(status_code=404, detail=f"No archive found for session: {session_id}")
+    return {"session_id": session_id, "entries": entries}
+
+@router.get("/archive/{session_id}/audio")
+async def get_archive_audio(session_id: str, start_ms: int = 0, end_ms: int = None):
+    if end_ms is None:
+        end_ms = start_ms + 60 * 1000  # Default to one minute of audio
+    if end_ms <= start_ms:
+        raise HTTPException(status_code=400, detail="end_ms must be greater than start_ms")
+    try:
+        wav_bytes = await asyncio.to_thread(
+            audio_archive.read_segment, session_id, start_ms, end_ms, bucket=audio_archive.archive_bucket
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return Response(content=wav_bytes, media_type="audio/wav")
+
+def parse_languages(language):
+    """Split a comma-separated language query parameter into a list with one code per base language.
+
+    Translation is done per base language, so "es,es-ES" keeps only "es".
+    """
+    languages = []
+    for code in (language or "").split(","):
+        code = code.strip()
+        if code and language_key(code) not in [language_key(existing) for existing in languages]:
+            languages.append(code)
+    return languages
+
 # Use /tmp directory for transcripts on GCP services
 static_dir = os.environ.get("STATIC_DIR", "/tmp/static")
 TRANSCRIPT_DIR = f"{static_dir}/transcripts"
@@ -0,0 +1,143 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+import logging
+import os
+import re
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Same storage layout as routes/tts.py
+static_dir = os.environ.get("STATIC_DIR", "/tmp/static")
+AUDIO_DIR = os.environ.get("AUDIO_DIR", f"{static_dir}/audio")
+
+# Generated audio is named after the SHA-256 of its content, so those URLs never change meaning
+CONTENT_ADDRESSED_NAME = re.compile(r"[0-9a-f]{32,64}")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MUTABLE_CACHE_CONTROL = "no-cache"
+# Served instead of a requested variant that is still being rendered; must not be pinned by caches
+FALLBACK_CACHE_CONTROL = "public, max-age=60"
+
+# Alternative encodings stored next to the MP3 under the same content hash
+VARIANTS = {
+    "opus": (".ogg", "audio/ogg"),
+    "mp3": (".mp3", "audio/mpeg"),
+}
+MEDIA_TYPES = {extension: media_type for extension, media_type in VARIANTS.values()}
+MEDIA_TYPES[".json"] = "application/json"
+
+READ_BLOCK_SIZE = 64 * 1024
+
+router = APIRouter()
+
+def resolve_audio_path(path):
+    """Map a URL path to a file inside AUDIO_DIR, refusing anything that escapes it."""
+    root = os.path.realpath(AUDIO_DIR)
+    full_path = os.path.realpath(os.path.join(root, path))
+    if not full_path.startswith(root + os.sep):
+        raise HTTPException(status_code=404, detail="Not found")
+    return full_path
+
+def choose_variant(full_path, requested_format, accept):
+    """Pick the stored encoding to serve.
+
+    Returns (path, format name or None, whether a requested variant was missing).
+    """
+    base, extension = os.path.splitext(full_path)
+    if extension != ".mp3":
+        return full_path, None, False
+
+    if requested_format:
+        wanted = [requested_format]
+    else:
+        # Prefer Opus when the client says it can play it; it is smaller at the same quality
+        wanted = ["opus"] if "audio/ogg" in accept or "audio/opus" in accept else []
+
+    for name in wanted:
+        if name in VARIANTS:
+            candidate = base + VARIANTS[name][0]
+            if os.path.exists(candidate):
+                return candidate, name, False
+    return full_path, None, any(name != "mp3" for name in wanted)
+
+def parse_range(header, size):
+    """Parse a single 'bytes=' range. Returns (start, end) inclusive, or None if unsatisfiable.
+
+    Raises ValueError for forms that are not supported (multiple ranges, other
+    units, malformed headers); callers ignore the header and send the full body.
+    """
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        raise ValueError(f"Unsupported range: {header!r}")
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(match.group(2)), 0)
+        end = size - 1
+    end = min(end, size - 1)
+    if start > end:
+        return None
+    return start, end
+
+def iter_file(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(READ_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+@router.api_route("/static/audio/{path:path}", methods=["GET", "HEAD"])
+async def serve_audio(path: str, request: Request, format: str = None):
+    """Serve generated audio with long-lived caching, ETags, range requests and encoding variants."""
+    full_path, variant, fallback = choose_variant(resolve_audio_path(path), format, request.headers.get("accept", ""))
+    if not os.path.isfile(full_path):
+        raise HTTPException(status_code=404, detail="Not found")
+
+    stat = os.stat(full_path)
+    name, extension = os.path.splitext(os.path.basename(full_path))
+    content_addressed = CONTENT_ADDRESSED_NAME.fullmatch(name) is not None
+    etag = f'"{name}{extension}"' if content_addressed else f'"{int(stat.st_mtime)}-{stat.st_size}"'
+
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if content_addressed else MUTABLE_CACHE_CONTROL,
+    }
+    if fallback:
+        # The variant may appear shortly (it is rendered in the background); let caches ask again
+        headers["Cache-Control"] = FALLBACK_CACHE_CONTROL
+    if not format:
+        headers["Vary"] = "Accept"
+    media_type = MEDIA_TYPES.get(extension, "application/octet-stream")
+
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    start, end = 0, stat.st_size - 1
+    status_code = 200
+    range_header = request.headers.get("range")
+    # If-Range: only honour the range if the client's copy is still current
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            byte_range = (start, end)  # Unsupported range form: serve the whole file
+        else:
+            if byte_range is None:
+                headers["Content-Range"] = f"bytes */{stat.st_size}"
+                return Response(status_code=416, headers=headers)
+            status_code = 206
+            headers["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{stat.st_size}"
+        start, end = byte_range
+
+    length = end - start + 1
+    headers["Content-Length"] = str(length)
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(iter_file(full_path, start, length), status_code=status_code, headers=headers, media_type=media_type)
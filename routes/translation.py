@@ -1,9 +1,50 @@
-from fastapi import APIRouter
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
 from config import translate_client
+from services.translation_memory import translation_memory
+from services.api_scheduler import api_scheduler, PRIORITY_HIGH
+from routes.server import require_admin
 
 router = APIRouter()
 
+# Model for adding a clinician-approved translation to the translation memory
+class ApprovedTranslationRequest(BaseModel):
+    text: str
+    translation: str
+    target_language: str
+
 @router.post("/translate/")
 async def translate_text(text: str, target_language: str = "fr"):
-    translation = translate_client.translate(text, target_language=target_language)
-    return {"translated_text": translation["translatedText"]}
+    # Consult the translation memory before calling Google (exact matches only)
+    suggestions = []
+    if translation_memory:
+        stored = translation_memory.lookup(text, target_language)
+        if stored:
+            return {"translated_text": stored, "from_memory": True, "suggestions": []}
+        # Approved wording for similar phrases, for the clinician to review - never a substitute
+        suggestions = translation_memory.suggestions(text, target_language)
+
+    # The scheduler may block waiting for quota or backing off, so keep it off the event loop
+    translation = await asyncio.to_thread(
+        api_scheduler.call,
+        "translate",
+        translate_client.translate,
+        text,
+        target_language=target_language,
+        priority=PRIORITY_HIGH,
+        coalesce_key=(target_language, text)
+    )
+    if translation_memory:
+        translation_memory.record(text, target_language, translation["translatedText"])
+    return {"translated_text": translation["translatedText"], "from_memory": False, "suggestions": suggestions}
+
+# Approved entries are served to patients as exact matches, so only admins may add them
+@router.post("/translation_memory/", dependencies=[Depends(require_admin)])
+async def add_approved_translation(request: ApprovedTranslationRequest):
+    """Store a clinician-approved translation so the same wording is reused for this phrase."""
+    if not translation_memory or translation_memory.read_only:
+        raise HTTPException(status_code=503, detail="Translation memory is not writable")
+    if not translation_memory.record(request.text, request.target_language, request.translation, approved=True):
+        raise HTTPException(status_code=400, detail="Translation could not be stored")
+    return {"message": "Translation stored"}
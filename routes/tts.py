@@ -1,14 +1,21 @@
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
 from google.cloud import texttospeech, translate_v2 as translate
 from pydantic import BaseModel
+from typing import List, Optional
 import logging
 import uuid
 import os
 import json
 import time
 import asyncio
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import storage  # Changed from Azure to Google Cloud Storage
+from services.api_scheduler import api_scheduler, PRIORITY_HIGH, PRIORITY_LOW
+from services.transcript_store import transcript_store, SESSION_ID_PATTERN
+from routes.server import require_admin
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -26,6 +33,23 @@ TRANSCRIPT_DIR = os.environ.get("TRANSCRIPT_DIR", f"{static_dir}/transcripts")
 os.makedirs(AUDIO_DIR, exist_ok=True)
 os.makedirs(TRANSCRIPT_DIR, exist_ok=True)
 
+# Extra encodings rendered next to each MP3 (comma separated, e.g. "opus") for clients on poor connections
+AUDIO_VARIANTS = [v.strip() for v in os.environ.get("AUDIO_VARIANTS", "").split(",") if v.strip()]
+
+# Cache policy for content-addressed files, which never change once written
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Content types by file extension for uploaded files
+CONTENT_TYPES = {".mp3": "audio/mpeg", ".ogg": "audio/ogg", ".json": "application/json"}
+
+# Bulk synthesis jobs: worker threads shared by all jobs, jobs running at once, and phrase x voice entries per job
+BULK_TTS_CONCURRENCY = int(os.environ.get("BULK_TTS_CONCURRENCY", 4))
+BULK_TTS_MAX_JOBS = int(os.environ.get("BULK_TTS_MAX_JOBS", 2))
+BULK_TTS_MAX_ENTRIES = int(os.environ.get("BULK_TTS_MAX_ENTRIES", 5000))
+
+# How long a finished bulk job's status stays available (seconds); its manifest is kept in storage
+BULK_TTS_JOB_TTL = float(os.environ.get("BULK_TTS_JOB_TTL", 3600))
+
 # Initialize Google Cloud Storage client (if environment variables are set)
 storage_client = None
 bucket_name = os.environ.get("GCS_BUCKET_NAME")
@@ -38,21 +62,48 @@ if bucket_name:
 
 router = APIRouter()
 
+# Bulk synthesis jobs by job ID (in-memory, per instance)
+bulk_jobs = {}
+
+# Bulk jobs block their threads waiting for TTS quota, so they get their own pool instead of the
+# default executor that live sessions use for translations and uploads
+bulk_executor = ThreadPoolExecutor(max_workers=BULK_TTS_CONCURRENCY, thread_name_prefix="bulk-tts")
+
+# Background renders of audio variants, referenced so they are not garbage collected while running
+variant_tasks = set()
+
 # Model for saving transcript
 class SaveTranscriptRequest(BaseModel):
     content: str
     filename: str = "translated_text.txt"
     language: str = "es"
+    session_id: str = None
 
 # Model for TTS request
 class TextToSpeechRequest(BaseModel):
     text: str = None
     language_code: str = ""
     use_saved_file: bool = False
+    session_id: str = None
+
+# Model for one voice in a bulk synthesis job
+class VoiceSpec(BaseModel):
+    language_code: str
+    name: Optional[str] = None
+
+# Model for bulk synthesis of a phrase library
+class BulkTextToSpeechRequest(BaseModel):
+    phrases: List[str]
+    voices: List[VoiceSpec]
 
 # Function to save file to Google Cloud Storage or local filesystem
-async def save_to_storage(folder_name, blob_name, content, is_binary=False):
+async def save_to_storage(folder_name, blob_name, content, is_binary=False, cache_control=None):
     """Save content to storage (Google Cloud Storage or local filesystem)."""
+    # Uploads and disk writes block, so keep them off the event loop
+    return await asyncio.to_thread(write_to_storage, folder_name, blob_name, content, is_binary, cache_control)
+
+def write_to_storage(folder_name, blob_name, content, is_binary=False, cache_control=None):
+    """Blocking implementation of save_to_storage."""
     if storage_client and bucket_name:
         try:
             # Use Google Cloud Storage
@@ -61,10 +112,13 @@ async def save_to_storage(folder_name, blob_name, content, is_binary=False):
             # Create full blob path with folder
             full_blob_name = f"{folder_name}/{blob_name}"
             blob = bucket.blob(full_blob_name)
+            if cache_control:
+                blob.cache_control = cache_control
             
             # Upload the content
             if is_binary:
-                blob.upload_from_string(content, content_type="audio/mpeg" if blob_name.endswith(".mp3") else "application/octet-stream")
+                content_type = CONTENT_TYPES.get(os.path.splitext(blob_name)[1], "application/octet-stream")
+                blob.upload_from_string(content, content_type=content_type)
             else:
                 blob.upload_from_string(content, content_type="text/plain")
             
@@ -92,6 +146,21 @@ async def save_to_storage(folder_name, blob_name, content, is_binary=False):
     relative_path = f"/static/{folder_name}/{blob_name}"
     return relative_path
 
+def find_in_storage(folder_name, blob_name):
+    """Return the URL of an existing stored file, or None if it has not been stored yet."""
+    if storage_client and bucket_name:
+        try:
+            blob = storage_client.bucket(bucket_name).blob(f"{folder_name}/{blob_name}")
+            if blob.exists():
+                return blob.public_url
+        except Exception as e:
+            logger.warning(f"Could not check Google Cloud Storage for {blob_name}: {e}")
+    
+    local_dir = AUDIO_DIR if folder_name == "audio" else TRANSCRIPT_DIR
+    if os.path.exists(os.path.join(local_dir, blob_name)):
+        return f"/static/{folder_name}/{blob_name}"
+    return None
+
 @router.post("/save_transcript/")
 async def save_transcript(request: SaveTranscriptRequest):
     start_time = time.time()
@@ -104,6 +173,13 @@ async def save_transcript(request: SaveTranscriptRequest):
             timestamp = int(time.time())
             request.filename = f"transcript_{timestamp}.txt"
 
+        # Client-edited text for a session is kept next to, not inside, the session's segment log,
+        # which holds only recognized FINAL segments
+        if request.session_id:
+            if not SESSION_ID_PATTERN.fullmatch(request.session_id):
+                raise HTTPException(status_code=400, detail=f"Invalid session id: {request.session_id!r}")
+            request.filename = f"sessions/{request.session_id}/{os.path.basename(request.filename)}"
+
         # Save to storage (GCS or local)
         file_url = await save_to_storage("transcripts", request.filename, request.content)
         
@@ -121,6 +197,9 @@ async def save_transcript(request: SaveTranscriptRequest):
             }
         )
 
+    except HTTPException as e:
+        logger.error(f"HTTP Exception: {e.detail}")
+        raise e
     except Exception as e:
         print(f"[{time.time() - start_time:.3f}s] Error occurred: {str(e)}")
         logger.error(f"Error saving transcript: {str(e)}")
@@ -158,7 +237,17 @@ async def tts_from_file(request: TextToSpeechRequest):
         # Path to the translated text file - check if we're using Google Cloud Storage
         file_content = None
         
-        if storage_client and bucket_name:
+        # Prefer the session's own transcript log so concurrent users never read each other's text
+        if request.session_id:
+            try:
+                # Reading may restore the session from Google Cloud Storage, so keep it off the event loop
+                file_content = await asyncio.to_thread(transcript_store.text, request.session_id, request.language_code or None)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if not file_content:
+                raise HTTPException(status_code=404, detail=f"No transcript found for session: {request.session_id}")
+        
+        if file_content is None and storage_client and bucket_name:
             try:
                 # Try to get the file from Google Cloud Storage
                 bucket = storage_client.bucket(bucket_name)
@@ -205,8 +294,176 @@ async def tts_from_file(request: TextToSpeechRequest):
         logger.error(f"Unexpected error in file-based TTS: {str(e)}")
         raise HTTPException(status_code=500, detail=f"TTS from file error: {str(e)}")
 
+# Bulk synthesis of a phrase library into several voices
+@router.post("/tts/bulk/", dependencies=[Depends(require_admin)])
+async def start_bulk_tts(request: BulkTextToSpeechRequest):
+    phrases = [phrase.strip() for phrase in request.phrases if phrase and phrase.strip()]
+    if not phrases or not request.voices:
+        raise HTTPException(status_code=400, detail="At least one phrase and one voice are required")
+    total = len(phrases) * len(request.voices)
+    if total > BULK_TTS_MAX_ENTRIES:
+        raise HTTPException(status_code=400, detail=f"Job has {total} entries; the limit is {BULK_TTS_MAX_ENTRIES}")
+    running = sum(1 for job in bulk_jobs.values() if job["status"] in ("queued", "running"))
+    if running >= BULK_TTS_MAX_JOBS:
+        raise HTTPException(status_code=429, detail=f"{running} bulk jobs are already running; try again later")
+    
+    job_id = str(uuid.uuid4())
+    job = {
+        "job_id": job_id,
+        "status": "queued",
+        "created_at": time.time(),
+        "total": total,
+        "completed": 0,
+        "skipped": 0,
+        "failed": 0,
+        "manifest_url": None,
+        "entries": [
+            {"text": phrase, "language_code": voice.language_code, "voice_name": voice.name, "status": "pending", "audio_url": None}
+            for voice in request.voices
+            for phrase in phrases
+        ]
+    }
+    bulk_jobs[job_id] = job
+    # Keep a reference to the task so it is not garbage collected while running
+    job["task"] = asyncio.create_task(run_bulk_tts_job(job))
+    
+    logger.info(f"Started bulk TTS job {job_id} with {total} entries")
+    return {"job_id": job_id, "total": total, "status_url": f"/api/tts/bulk/{job_id}"}
+
+@router.get("/tts/bulk/{job_id}", dependencies=[Depends(require_admin)])
+async def get_bulk_tts_job(job_id: str):
+    job = bulk_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Bulk TTS job not found: {job_id}")
+    return {key: value for key, value in job.items() if key not in ("entries", "task")}
+
+async def run_bulk_tts_job(job):
+    """Synthesize every phrase/voice entry of a bulk job, skipping audio that is already stored."""
+    job["status"] = "running"
+    semaphore = asyncio.Semaphore(BULK_TTS_CONCURRENCY)
+    loop = asyncio.get_running_loop()
+    
+    def run_blocking(fn, *args, **kwargs):
+        return loop.run_in_executor(bulk_executor, functools.partial(fn, *args, **kwargs))
+    
+    async def process_entry(entry):
+        # Input-addressed name so re-running a job finds what was rendered before
+        key = f"{entry['language_code']}|{entry['voice_name'] or ''}|{entry['text']}"
+        blob_name = f"bulk/{hashlib.sha256(key.encode('utf-8')).hexdigest()}.mp3"
+        
+        async with semaphore:
+            try:
+                existing = await run_blocking(find_in_storage, "audio", blob_name)
+                if existing:
+                    entry["audio_url"] = existing
+                    entry["status"] = "skipped"
+                    job["skipped"] += 1
+                    return
+                
+                voice = texttospeech.VoiceSelectionParams(
+                    language_code=entry["language_code"],
+                    name=entry["voice_name"] or None,
+                    ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
+                )
+                # Low priority so live sessions' TTS goes first under the shared quota
+                audio_content = await run_blocking(
+                    synthesize,
+                    texttospeech.SynthesisInput(text=entry["text"]),
+                    voice,
+                    texttospeech.AudioEncoding.MP3,
+                    PRIORITY_LOW
+                )
+                entry["audio_url"] = await run_blocking(
+                    write_to_storage, "audio", blob_name, audio_content, is_binary=True, cache_control=IMMUTABLE_CACHE_CONTROL
+                )
+                entry["status"] = "completed"
+                job["completed"] += 1
+            except Exception as e:
+                logger.error(f"Bulk TTS entry failed ({entry['language_code']}): {e}")
+                entry["status"] = "failed"
+                entry["error"] = str(e)
+                job["failed"] += 1
+    
+    try:
+        await asyncio.gather(*(process_entry(entry) for entry in job["entries"]))
+        
+        manifest = {
+            "job_id": job["job_id"],
+            "created_at": job["created_at"],
+            "entries": job["entries"]
+        }
+        job["manifest_url"] = await run_blocking(
+            write_to_storage,
+            "audio",
+            f"bulk/manifests/{job['job_id']}.json",
+            json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"),
+            is_binary=True
+        )
+        job["status"] = "completed"
+        # The manifest holds the per-entry results now; keep only the summary in memory
+        job.pop("entries", None)
+        logger.info(f"Bulk TTS job {job['job_id']} finished: {job['completed']} rendered, {job['skipped']} skipped, {job['failed']} failed")
+    except Exception as e:
+        logger.error(f"Bulk TTS job {job['job_id']} failed: {e}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = time.time()
+        job.pop("task", None)
+        # Forget the job once its status has been available for BULK_TTS_JOB_TTL
+        asyncio.get_running_loop().call_later(BULK_TTS_JOB_TTL, bulk_jobs.pop, job["job_id"], None)
+
+# Session transcript retrieval, filtered by language and time range
+@router.get("/transcripts/{session_id}")
+async def get_session_transcript(session_id: str, language: str = None, start: float = None, end: float = None):
+    try:
+        segments = await asyncio.to_thread(transcript_store.segments, session_id, language, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "session_id": session_id,
+        "segments": segments
+    }
+
+def synthesize(synthesis_input, voice, audio_encoding, priority=PRIORITY_HIGH):
+    """Run one synthesis through the API scheduler and return the audio bytes.
+
+    Blocks while waiting for quota or backing off; call it from a worker thread.
+    """
+    response = api_scheduler.call(
+        "tts",
+        tts_client.synthesize_speech,
+        priority=priority,
+        input=synthesis_input,
+        voice=voice,
+        audio_config=texttospeech.AudioConfig(audio_encoding=audio_encoding)
+    )
+    return response.audio_content
+
+async def render_variants(synthesis_input, voice, content_hash):
+    """Store the AUDIO_VARIANTS encodings of an MP3 under its content hash, off the request path."""
+    if "opus" not in AUDIO_VARIANTS:
+        return
+    blob_name = f"{content_hash}.ogg"
+    try:
+        # Content-addressed, so a phrase that was rendered before already has its variant
+        if await asyncio.to_thread(find_in_storage, "audio", blob_name):
+            return
+        # Low priority: the variant is an optimization and must not delay live requests
+        opus_content = await asyncio.to_thread(
+            synthesize, synthesis_input, voice, texttospeech.AudioEncoding.OGG_OPUS, PRIORITY_LOW
+        )
+        await save_to_storage("audio", blob_name, opus_content, is_binary=True, cache_control=IMMUTABLE_CACHE_CONTROL)
+    except Exception as e:
+        logger.warning(f"Could not generate Opus variant: {e}")
+
 async def generate_audio_from_text(text: str, language_code: str) -> str:
-    """Generates speech from text and returns the file URL."""
+    """Generates speech from text and returns the file URL.
+
+    Files are named after the SHA-256 of the MP3 so their URLs can be cached
+    forever. Variants listed in AUDIO_VARIANTS are rendered in the background
+    and stored under the same hash with their own extension (e.g. ``<hash>.ogg``).
+    """
     try:
         # Create synthesis input
         synthesis_input = texttospeech.SynthesisInput(text=text)
@@ -217,25 +474,22 @@ async def generate_audio_from_text(text: str, language_code: str) -> str:
             ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
         )
         
-        # Configure audio
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3
-        )
-        
-        # Generate unique filename with timestamp to avoid caching issues
-        timestamp = int(time.time())
-        audio_filename = f"output_{timestamp}.mp3"
-        
         # Generate speech
         logger.info(f"Generating TTS for language: {language_code}")
-        response = tts_client.synthesize_speech(
-            input=synthesis_input,
-            voice=voice,
-            audio_config=audio_config
-        )
+        audio_content = await asyncio.to_thread(synthesize, synthesis_input, voice, texttospeech.AudioEncoding.MP3)
+        
+        # Content-addressed filename: identical audio always maps to the same immutable URL
+        content_hash = hashlib.sha256(audio_content).hexdigest()
+        audio_filename = f"{content_hash}.mp3"
         
         # Save audio file to appropriate storage
-        audio_url = await save_to_storage("audio", audio_filename, response.audio_content, is_binary=True)
+        audio_url = await save_to_storage("audio", audio_filename, audio_content, is_binary=True, cache_control=IMMUTABLE_CACHE_CONTROL)
+        
+        # Lighter variants are rendered in the background; until they exist the MP3 is served
+        if AUDIO_VARIANTS:
+            task = asyncio.create_task(render_variants(synthesis_input, voice, content_hash))
+            variant_tasks.add(task)
+            task.add_done_callback(variant_tasks.discard)
         
         logger.info(f"Audio saved to {audio_url}")
         
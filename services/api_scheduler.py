@@ -0,0 +1,197 @@
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from google.api_core import exceptions as google_exceptions
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Priority lanes - lower values are served first
+PRIORITY_HIGH = 0  # FINAL results, TTS and user-initiated requests
+PRIORITY_LOW = 1   # Interim translations
+LANE_NAMES = {PRIORITY_HIGH: "high", PRIORITY_LOW: "low"}
+
+# Per-API quotas as (requests per second, burst size). A rate of 0 disables the limit.
+API_LIMITS = {
+    "translate": (float(os.environ.get("TRANSLATE_QPS", 10)), int(os.environ.get("TRANSLATE_BURST", 20))),
+    "tts": (float(os.environ.get("TTS_QPS", 5)), int(os.environ.get("TTS_BURST", 10))),
+    "speech": (float(os.environ.get("SPEECH_STREAMS_PER_SECOND", 2)), int(os.environ.get("SPEECH_STREAMS_BURST", 5))),
+}
+
+# Project-wide quota shared by every API call (0 disables it)
+PROJECT_LIMIT = (float(os.environ.get("GOOGLE_PROJECT_QPS", 0)), int(os.environ.get("GOOGLE_PROJECT_BURST", 50)))
+
+# Retry policy for quota and transient errors
+MAX_RETRIES = int(os.environ.get("API_MAX_RETRIES", 4))
+RETRY_BASE_DELAY = float(os.environ.get("API_RETRY_BASE_DELAY", 0.25))
+RETRY_MAX_DELAY = float(os.environ.get("API_RETRY_MAX_DELAY", 8.0))
+
+RETRYABLE_EXCEPTIONS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+)
+
+class TokenBucket:
+    """Classic token bucket. Not thread-safe on its own; the scheduler holds the lock."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, now):
+        if self.rate <= 0:
+            return True
+        self._refill(now)
+        return self.tokens >= 1
+
+    def take(self):
+        if self.rate > 0:
+            self.tokens -= 1
+
+    def time_until_token(self, now):
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+class ApiScheduler:
+    """Central gate for Google API calls.
+
+    Every call takes a token from its API bucket and the project bucket, waiting
+    in a priority queue when quota is exhausted. Quota and transient errors are
+    retried with jittered exponential backoff, and identical in-flight calls
+    (same coalesce key) share one request.
+    """
+
+    def __init__(self, limits=API_LIMITS, project_limit=PROJECT_LIMIT):
+        self._lock = threading.Condition()
+        self._buckets = {api: TokenBucket(rate, burst) for api, (rate, burst) in limits.items()}
+        self._project_bucket = TokenBucket(*project_limit)
+        self._waiters = {api: [] for api in limits}
+        self._sequence = itertools.count()
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self._metrics = {}
+
+    def _record(self, api, priority, **values):
+        key = (api, LANE_NAMES.get(priority, str(priority)))
+        with self._in_flight_lock:
+            stats = self._metrics.setdefault(key, {
+                "calls": 0, "wait_total": 0.0, "wait_max": 0.0,
+                "retries": 0, "errors": 0, "coalesced": 0,
+            })
+            for name, value in values.items():
+                if name == "wait":
+                    stats["calls"] += 1
+                    stats["wait_total"] += value
+                    stats["wait_max"] = max(stats["wait_max"], value)
+                else:
+                    stats[name] += value
+
+    def acquire(self, api, priority=PRIORITY_LOW):
+        """Block until a token is available for the API, serving higher priorities first."""
+        bucket = self._buckets[api]
+        waiters = self._waiters[api]
+        ticket = (priority, next(self._sequence))
+        start = time.monotonic()
+
+        with self._lock:
+            heapq.heappush(waiters, ticket)
+            while True:
+                now = time.monotonic()
+                if waiters[0] == ticket and bucket.available(now) and self._project_bucket.available(now):
+                    heapq.heappop(waiters)
+                    bucket.take()
+                    self._project_bucket.take()
+                    # Let the next waiter check the bucket
+                    self._lock.notify_all()
+                    break
+                delay = max(bucket.time_until_token(now), self._project_bucket.time_until_token(now))
+                self._lock.wait(timeout=delay if delay > 0 else 0.05)
+
+        waited = time.monotonic() - start
+        self._record(api, priority, wait=waited)
+        return waited
+
+    def call(self, api, fn, *args, priority=PRIORITY_LOW, coalesce_key=None, retry=True, **kwargs):
+        """Run fn under the API's quota, with retries and optional coalescing of identical calls.
+
+        Blocks the calling thread while waiting for quota or backing off, so async
+        code must run it with ``asyncio.to_thread``.
+        """
+        if coalesce_key is None:
+            return self._call_with_retry(api, fn, args, kwargs, priority, retry)
+
+        key = (api, coalesce_key)
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not owner:
+            self._record(api, priority, coalesced=1)
+            return future.result()
+
+        try:
+            result = self._call_with_retry(api, fn, args, kwargs, priority, retry)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.pop(key, None)
+
+    def _call_with_retry(self, api, fn, args, kwargs, priority, retry):
+        attempt = 0
+        while True:
+            self.acquire(api, priority)
+            try:
+                return fn(*args, **kwargs)
+            except RETRYABLE_EXCEPTIONS as e:
+                if not retry or attempt >= MAX_RETRIES:
+                    self._record(api, priority, errors=1)
+                    raise
+                # Full jitter keeps a burst of sessions from retrying in lockstep
+                delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+                logger.warning(f"{api} call failed ({e}); retrying in {delay:.2f}s")
+                self._record(api, priority, retries=1)
+                attempt += 1
+                time.sleep(delay)
+            except Exception:
+                self._record(api, priority, errors=1)
+                raise
+
+    def metrics(self):
+        """Queue wait times and retry counters per API and priority lane."""
+        with self._in_flight_lock:
+            result = {}
+            for (api, lane), stats in self._metrics.items():
+                calls = stats["calls"]
+                result.setdefault(api, {})[lane] = {
+                    **stats,
+                    "wait_avg": stats["wait_total"] / calls if calls else 0.0,
+                }
+            return result
+
+# Shared scheduler used by every Google API call site
+api_scheduler = ApiScheduler()
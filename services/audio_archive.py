@@ -0,0 +1,259 @@
+import io
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import wave
+
+import numpy as np
+
+# soundfile (libsndfile) provides FLAC; without it chunks are archived as plain WAV
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Archiving is opt-in because it keeps patient audio
+AUDIO_ARCHIVE_ENABLED = os.environ.get("AUDIO_ARCHIVE", "").lower() in ("1", "true", "yes")
+AUDIO_ARCHIVE_DIR = os.environ.get("AUDIO_ARCHIVE_DIR", "/tmp/audio_archive")
+ARCHIVE_CHUNK_SECONDS = float(os.environ.get("AUDIO_ARCHIVE_CHUNK_SECONDS", 10))
+
+# Archived audio is the preprocessed recognition stream: mono 16-bit PCM
+ARCHIVE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+CHUNK_EXTENSION = ".flac" if soundfile is not None else ".wav"
+INDEX_FILENAME = "index.jsonl"
+
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# Session directories being written by this process; their local index is always current
+_writing = set()
+
+def session_dir(session_id, root=AUDIO_ARCHIVE_DIR):
+    if not SESSION_ID_PATTERN.fullmatch(session_id or ""):
+        raise ValueError(f"Invalid session id: {session_id!r}")
+    return os.path.join(root, session_id)
+
+def encode_chunk(pcm, rate=ARCHIVE_RATE):
+    """Encode one chunk of PCM as a self-contained FLAC (or WAV) file."""
+    output = io.BytesIO()
+    if soundfile is not None:
+        samples = np.frombuffer(pcm, dtype="<i2")
+        soundfile.write(output, samples, rate, format="FLAC", subtype="PCM_16")
+    else:
+        with wave.open(output, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(SAMPLE_WIDTH)
+            wav_file.setframerate(rate)
+            wav_file.writeframes(pcm)
+    return output.getvalue()
+
+def decode_chunk(path):
+    """Decode one archived chunk back to raw PCM bytes.
+
+    Raises RuntimeError when the chunk is FLAC and soundfile is not installed here.
+    """
+    if path.endswith(".flac"):
+        if soundfile is None:
+            raise RuntimeError("soundfile is not installed on this instance, so FLAC archive chunks cannot be decoded")
+        samples, _ = soundfile.read(path, dtype="int16")
+        return samples.tobytes()
+    with wave.open(path, "rb") as wav_file:
+        return wav_file.readframes(wav_file.getnframes())
+
+class SessionArchive:
+    """Archives a session's recognition audio as fixed-duration compressed chunks.
+
+    ``tap`` only enqueues the chunk's bytes, so the live recognition path pays
+    for a queue put; encoding, disk writes and uploads happen on a background
+    thread. ``index.jsonl`` maps time offsets to chunk files and to recognition
+    results, so any segment can be replayed by decoding only the chunks it spans.
+    With a bucket, the index is uploaded after every chunk so a session that
+    dies mid-way can still be replayed from another instance; an ``end``
+    record marks an index that will not change any more.
+    """
+
+    def __init__(self, session_id, root=AUDIO_ARCHIVE_DIR, bucket=None, chunk_seconds=ARCHIVE_CHUNK_SECONDS):
+        self.session_id = session_id
+        self.directory = session_dir(session_id, root)
+        self.bucket = bucket
+        self.chunk_bytes = int(chunk_seconds * ARCHIVE_RATE) * SAMPLE_WIDTH
+        self._queue = queue.Queue()
+        self._buffer = bytearray()
+        self._seq = 0
+        self._samples_written = 0
+        os.makedirs(self.directory, exist_ok=True)
+        _writing.add(self.directory)
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    def tap(self, pcm):
+        """Hand a chunk of recognition audio to the archive (non-blocking)."""
+        self._queue.put_nowait(("audio", pcm))
+
+    def record_result(self, transcript, is_final, end_offset):
+        """Note a recognition result at ``end_offset`` seconds from the start of the stream."""
+        self._queue.put_nowait(("result", {
+            "type": "result",
+            "end_ms": int(end_offset * 1000),
+            "is_final": is_final,
+            "transcript": transcript,
+        }))
+
+    def close(self, timeout=10.0):
+        """Flush the last partial chunk and wait for the writer to finish."""
+        self._queue.put(("close", None))
+        self._thread.join(timeout)
+
+    def _writer(self):
+        index_path = os.path.join(self.directory, INDEX_FILENAME)
+        try:
+            with open(index_path, "a", encoding="utf-8") as index_file:
+                while True:
+                    kind, item = self._queue.get()
+                    try:
+                        if kind == "audio":
+                            self._buffer += item
+                            while len(self._buffer) >= self.chunk_bytes:
+                                self._write_chunk(index_file, index_path, bytes(self._buffer[:self.chunk_bytes]))
+                                del self._buffer[:self.chunk_bytes]
+                        elif kind == "result":
+                            index_file.write(json.dumps(item, ensure_ascii=False) + "\n")
+                        else:
+                            if self._buffer:
+                                self._write_chunk(index_file, index_path, bytes(self._buffer))
+                                self._buffer.clear()
+                            index_file.write(json.dumps({
+                                "type": "end",
+                                "end_ms": self._samples_written * 1000 // ARCHIVE_RATE,
+                            }) + "\n")
+                            index_file.flush()
+                            break
+                        index_file.flush()
+                    except Exception as e:
+                        logger.error(f"Error archiving audio for session {self.session_id}: {e}")
+
+            if self.bucket is not None:
+                self._upload(index_path, INDEX_FILENAME)
+        finally:
+            _writing.discard(self.directory)
+
+    def _write_chunk(self, index_file, index_path, pcm):
+        filename = f"{self._seq:06d}{CHUNK_EXTENSION}"
+        with open(os.path.join(self.directory, filename), "wb") as chunk_file:
+            chunk_file.write(encode_chunk(pcm))
+
+        samples = len(pcm) // SAMPLE_WIDTH
+        index_file.write(json.dumps({
+            "type": "chunk",
+            "seq": self._seq,
+            "file": filename,
+            "start_ms": self._samples_written * 1000 // ARCHIVE_RATE,
+            "end_ms": (self._samples_written + samples) * 1000 // ARCHIVE_RATE,
+            "start_sample": self._samples_written,
+            "samples": samples,
+        }) + "\n")
+        self._samples_written += samples
+        self._seq += 1
+
+        if self.bucket is not None:
+            # Chunk first, then the index that references it, so the uploaded index never points at a missing chunk
+            self._upload(os.path.join(self.directory, filename), filename)
+            index_file.flush()
+            self._upload(index_path, INDEX_FILENAME)
+
+    def _upload(self, path, name):
+        try:
+            self.bucket.blob(f"archive/{self.session_id}/{name}").upload_from_filename(path)
+        except Exception as e:
+            logger.error(f"Error uploading archive file {name} for session {self.session_id}: {e}")
+
+def read_index(session_id, root=AUDIO_ARCHIVE_DIR, bucket=None):
+    """Return the archive index entries (chunks and recognition results) of a session.
+
+    A local copy is trusted when this process is writing the session or the
+    copy is complete (ends with an ``end`` record); otherwise the index is
+    fetched again from the bucket, since another instance may still be adding to it.
+    """
+    directory = session_dir(session_id, root)
+    index_path = os.path.join(directory, INDEX_FILENAME)
+    entries = _load_index(index_path)
+    complete = bool(entries) and entries[-1]["type"] == "end"
+    if bucket is not None and directory not in _writing and not complete:
+        if _download(session_id, INDEX_FILENAME, index_path, bucket):
+            entries = _load_index(index_path)
+    return entries
+
+def _load_index(index_path):
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, "r", encoding="utf-8") as index_file:
+        # A line cut off by a concurrent write is skipped
+        entries = []
+        for line in index_file:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                pass
+        return entries
+
+def read_segment(session_id, start_ms, end_ms, root=AUDIO_ARCHIVE_DIR, bucket=None):
+    """Return WAV bytes for [start_ms, end_ms), decoding only the chunks that overlap it.
+
+    Raises FileNotFoundError when a chunk is neither on disk nor downloadable,
+    and RuntimeError when a chunk cannot be decoded on this instance.
+    """
+    directory = session_dir(session_id, root)
+    pcm = bytearray()
+    for entry in read_index(session_id, root, bucket):
+        if entry["type"] != "chunk" or entry["end_ms"] <= start_ms or entry["start_ms"] >= end_ms:
+            continue
+        path = os.path.join(directory, entry["file"])
+        if not os.path.exists(path) and not (bucket is not None and _download(session_id, entry["file"], path, bucket)):
+            raise FileNotFoundError(f"Archive chunk {entry['file']} of session {session_id} is not available")
+        data = decode_chunk(path)
+
+        # Trim to the requested range using exact sample positions
+        first = max(start_ms * ARCHIVE_RATE // 1000 - entry["start_sample"], 0)
+        last = min(end_ms * ARCHIVE_RATE // 1000 - entry["start_sample"], entry["samples"])
+        pcm += data[first * SAMPLE_WIDTH:last * SAMPLE_WIDTH]
+
+    output = io.BytesIO()
+    with wave.open(output, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(SAMPLE_WIDTH)
+        wav_file.setframerate(ARCHIVE_RATE)
+        wav_file.writeframes(bytes(pcm))
+    return output.getvalue()
+
+def _download(session_id, name, path, bucket):
+    """Fetch an archive file from the bucket, replacing the local copy only on success."""
+    partial_path = f"{path}.download"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        bucket.blob(f"archive/{session_id}/{name}").download_to_filename(partial_path)
+        os.replace(partial_path, path)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not download archive file {name} for session {session_id}: {e}")
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
+        return False
+
+# Bucket for off-host copies of the archive, when configured
+archive_bucket = None
+if AUDIO_ARCHIVE_ENABLED and os.environ.get("GCS_BUCKET_NAME"):
+    try:
+        from google.cloud import storage
+        archive_bucket = storage.Client().bucket(os.environ["GCS_BUCKET_NAME"])
+    except Exception as e:
+        logger.error(f"Error initializing Google Cloud Storage for the audio archive: {e}")
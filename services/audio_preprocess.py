@@ -0,0 +1,151 @@
+import math
+import os
+
+import numpy as np
+
+# Format expected by Speech-to-Text: mono 16-bit PCM at 16 kHz
+TARGET_RATE = 16000
+
+# Capture formats accepted from clients. Arbitrary rates would make the resampler's filter
+# length explode (a prime rate gives up=16000 and millions of taps).
+SUPPORTED_RATES = (8000, 11025, 16000, 22050, 32000, 44100, 48000)
+MAX_CHANNELS = 8
+
+# Resampling filter quality: taps per polyphase branch (scaled up for large decimation ratios),
+# Kaiser window beta, and cutoff as a fraction of the output Nyquist frequency
+TAPS_PER_PHASE = 24
+KAISER_BETA = 8.0
+ROLLOFF = 0.9
+
+# Gain normalization: target RMS (about -20 dBFS), maximum boost, and the level treated as silence
+NORMALIZE_GAIN = os.environ.get("AUDIO_GAIN_NORMALIZATION", "true").lower() in ("1", "true", "yes")
+TARGET_RMS = 0.1
+MAX_GAIN = 10.0
+SILENCE_RMS = 0.003
+
+# Smoothing of the applied gain per chunk: fast when turning down (attack), slow when turning up (release)
+GAIN_ATTACK = 0.5
+GAIN_RELEASE = 0.1
+
+def design_lowpass(up, down, taps_per_phase=TAPS_PER_PHASE, beta=KAISER_BETA):
+    """Kaiser-windowed sinc anti-aliasing filter for resampling by up/down."""
+    num_taps = up * taps_per_phase
+    cutoff = ROLLOFF / max(up, down)  # Normalized to the upsampled Nyquist rate
+    n = np.arange(num_taps) - (num_taps - 1) / 2.0
+    h = cutoff * np.sinc(cutoff * n) * np.kaiser(num_taps, beta)
+    # Gain of `up` compensates for the zeros inserted by upsampling
+    return (h * (up / h.sum())).astype(np.float32)
+
+class PolyphaseResampler:
+    """Streaming rational resampler that keeps filter state across chunks.
+
+    Only the filter taps that line up with real input samples are evaluated
+    (the polyphase decomposition), and each chunk is computed as a single
+    gather + multiply-accumulate over all of its output samples.
+    """
+
+    def __init__(self, in_rate, out_rate=TARGET_RATE, taps_per_phase=TAPS_PER_PHASE):
+        g = math.gcd(in_rate, out_rate)
+        self.up = out_rate // g
+        self.down = in_rate // g
+        # Decimating needs a longer filter (in input samples) for the same transition band
+        self.taps = taps_per_phase * max(1, -(-self.down // self.up))
+
+        h = design_lowpass(self.up, self.down, self.taps)
+        # phases[p, k] = h[p + k * up]
+        self.phases = h.reshape(self.taps, self.up).T.copy()
+
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._consumed = 0  # Input samples seen before the current chunk
+        self._next_output = 0  # Index of the next output sample to produce
+        self._tap_offsets = np.arange(self.taps)
+
+    def process(self, samples):
+        if len(samples) == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        buffer = np.concatenate((self._history, samples))
+        total = self._consumed + len(samples)
+
+        # Every output whose newest input sample falls inside this chunk
+        end_output = -(-total * self.up // self.down)
+        outputs = np.arange(self._next_output, end_output, dtype=np.int64)
+        positions = outputs * self.down
+        input_index = positions // self.up
+        phase = positions % self.up
+
+        # Row n holds input samples i, i-1, ..., i-K+1 for output n (indices relative to the buffer)
+        local = input_index - (self._consumed - (self.taps - 1))
+        windows = buffer[local[:, None] - self._tap_offsets[None, :]]
+        result = np.einsum("nk,nk->n", windows, self.phases[phase])
+
+        self._history = buffer[-(self.taps - 1):]
+        self._consumed = total
+        self._next_output = end_output
+        return result
+
+class AudioPreprocessor:
+    """Converts captured 16-bit PCM chunks into the mono 16 kHz stream Speech-to-Text expects.
+
+    Stages: channel downmix, polyphase resampling and smoothed gain
+    normalization. Input bytes are viewed with np.frombuffer rather than
+    copied, and audio that is already mono 16 kHz skips the resampler.
+    """
+
+    def __init__(self, in_rate, channels=1, out_rate=TARGET_RATE, normalize=NORMALIZE_GAIN):
+        if in_rate not in SUPPORTED_RATES:
+            raise ValueError(f"Unsupported sample rate {in_rate}; use one of {', '.join(map(str, SUPPORTED_RATES))}")
+        if not 1 <= channels <= MAX_CHANNELS:
+            raise ValueError(f"Unsupported channel count {channels}; use 1 to {MAX_CHANNELS}")
+        self.in_rate = in_rate
+        self.channels = channels
+        self.out_rate = out_rate
+        self.normalize = normalize
+        self.frame_bytes = 2 * channels
+        self.gain = 1.0
+        self.resampler = PolyphaseResampler(in_rate, out_rate) if in_rate != out_rate else None
+        self._remainder = b""
+
+    @property
+    def passthrough(self):
+        """True when the input already matches the output format and nothing needs doing."""
+        return self.resampler is None and self.channels == 1 and not self.normalize
+
+    def process(self, chunk):
+        if self.passthrough:
+            return chunk
+
+        # Carry over a partial frame so samples never split across chunks
+        if self._remainder:
+            chunk = self._remainder + chunk
+        usable = len(chunk) - len(chunk) % self.frame_bytes
+        self._remainder = chunk[usable:]
+        if usable == 0:
+            return b""
+
+        pcm = np.frombuffer(chunk, dtype="<i2", count=usable // 2)
+
+        # Downmix: average the interleaved channels
+        if self.channels > 1:
+            samples = pcm.reshape(-1, self.channels).mean(axis=1, dtype=np.float32)
+        else:
+            samples = pcm.astype(np.float32)
+        samples *= 1.0 / 32768.0
+
+        if self.resampler is not None:
+            samples = self.resampler.process(samples)
+
+        if self.normalize and len(samples):
+            self._apply_gain(samples)
+
+        np.clip(samples, -1.0, 32767.0 / 32768.0, out=samples)
+        return (samples * 32768.0).astype("<i2").tobytes()
+
+    def _apply_gain(self, samples):
+        rms = float(np.sqrt(np.mean(np.square(samples))))
+        # Hold the current gain through silence so background noise is not pumped up
+        if rms > SILENCE_RMS:
+            wanted = min(TARGET_RMS / rms, MAX_GAIN)
+            rate = GAIN_ATTACK if wanted < self.gain else GAIN_RELEASE
+            self.gain += (wanted - self.gain) * rate
+        samples *= self.gain
@@ -1,3 +1,5 @@
+import mmap
+import os
 import pyaudio
 import wave
 
@@ -8,31 +10,134 @@ RATE = 16000
 CHUNK = 1024
 AUDIO_FILE = "recorded_audio.wav"
 
-def record_audio(duration):
-    """Records audio from the microphone and saves it as a .wav file."""
+class RingFileBuffer:
+    """Fixed-size, memory-mapped ring file holding the most recent audio.
+
+    Memory use is bounded by the window regardless of how long the recording
+    runs; the OS pages the mapping to disk as needed.
+    """
+
+    def __init__(self, path, capacity, frame_size):
+        # Keep the capacity a whole number of frames so samples never straddle the wrap point
+        self.capacity = capacity - capacity % frame_size
+        self.path = path
+        self.position = 0
+        self.wrapped = False
+        self._file = open(path, "w+b")
+        self._file.truncate(self.capacity)
+        self._map = mmap.mmap(self._file.fileno(), self.capacity)
+
+    def write(self, data):
+        view = memoryview(data)
+        # Only the tail of an oversized write can survive in the window
+        if len(view) > self.capacity:
+            view = view[-self.capacity:]
+            self.wrapped = True
+        end = self.position + len(view)
+        if end <= self.capacity:
+            self._map[self.position:end] = view
+        else:
+            first = self.capacity - self.position
+            self._map[self.position:] = view[:first]
+            self._map[:end - self.capacity] = view[first:]
+        # Reaching the end exactly also wraps: the whole buffer now holds valid audio
+        if end >= self.capacity:
+            self.wrapped = True
+        self.position = end % self.capacity
+
+    def write_to(self, wav_file):
+        """Write the buffered audio to a wave file in chronological order without copying the mapping."""
+        with memoryview(self._map) as view:
+            if self.wrapped:
+                with view[self.position:] as older:
+                    wav_file.writeframesraw(older)
+            with view[:self.position] as newer:
+                wav_file.writeframesraw(newer)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+        os.remove(self.path)
+
+def record_from_stream(stream, output_path, chunk=CHUNK, channels=CHANNELS, rate=RATE,
+                       sample_width=2, duration=None, stop_event=None, consumer=None,
+                       window_seconds=None):
+    """Streams audio read from ``stream`` into a .wav file as it arrives.
+
+    Recording stops after ``duration`` seconds, or when ``stop_event`` is set if
+    no duration is given. Each chunk is also passed as-is to ``consumer`` (for
+    example ``audio_queue.put``) so a live pipeline can use the same bytes. With
+    ``window_seconds`` only the most recent window is kept, in a memory-mapped
+    ring file, and written out when recording ends.
+    """
+    frame_size = channels * sample_width
+    total_chunks = int(rate / chunk * duration) if duration is not None else None
+
+    wav_file = wave.open(output_path, "wb")
+    wav_file.setnchannels(channels)
+    wav_file.setsampwidth(sample_width)
+    wav_file.setframerate(rate)
+
+    ring = None
+    if window_seconds:
+        ring = RingFileBuffer(f"{output_path}.ring", int(window_seconds * rate) * frame_size, frame_size)
+
+    chunks_read = 0
+    try:
+        while total_chunks is None or chunks_read < total_chunks:
+            if stop_event is not None and stop_event.is_set():
+                break
+            data = stream.read(chunk)
+            chunks_read += 1
+
+            if consumer is not None:
+                consumer(data)
+
+            if ring is not None:
+                ring.write(data)
+            else:
+                wav_file.writeframesraw(data)
+
+        if ring is not None:
+            ring.write_to(wav_file)
+    finally:
+        # Closing patches the header with the final frame count
+        wav_file.close()
+        if ring is not None:
+            ring.close()
+
+    return output_path
+
+def record_audio(duration=None, output_path=AUDIO_FILE, stop_event=None, consumer=None, window_seconds=None):
+    """Records audio from the microphone and streams it to a .wav file.
+
+    Either ``duration`` or ``stop_event`` must be given so the recording can end.
+    """
+    if duration is None and stop_event is None:
+        raise ValueError("record_audio needs a duration or a stop_event")
+
     audio = pyaudio.PyAudio()
     stream = audio.open(format=FORMAT, channels=CHANNELS,
                         rate=RATE, input=True,
                         frames_per_buffer=CHUNK)
 
     print("🎙️ Recording started... Speak now!")
-    frames = []
-    
-    for _ in range(0, int(RATE / CHUNK * duration)):
-        data = stream.read(CHUNK)
-        frames.append(data)
 
-    print("✅ Recording complete!")
+    try:
+        record_from_stream(
+            stream,
+            output_path,
+            sample_width=audio.get_sample_size(FORMAT),
+            duration=duration,
+            stop_event=stop_event,
+            consumer=consumer,
+            window_seconds=window_seconds
+        )
+    finally:
+        stream.stop_stream()
+        stream.close()
+        audio.terminate()
 
-    stream.stop_stream()
-    stream.close()
-    audio.terminate()
-
-    # Save the recorded audio as a .wav file
-    with wave.open(AUDIO_FILE, "wb") as wf:
-        wf.setnchannels(CHANNELS)
-        wf.setsampwidth(audio.get_sample_size(FORMAT))
-        wf.setframerate(RATE)
-        wf.writeframes(b"".join(frames))
+    print("✅ Recording complete!")
 
-    return AUDIO_FILE
+    return output_path
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+
+import psutil
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How long active sessions get to finish before they are stopped (seconds)
+DRAIN_TIMEOUT = float(os.environ.get("DRAIN_TIMEOUT", 30))
+
+# Poll interval while waiting for sessions to finish
+DRAIN_POLL_INTERVAL = 0.5
+
+class DrainState:
+    """Process-wide drain flag. Once set, new recognition sessions are refused."""
+
+    def __init__(self):
+        self.draining = False
+        self.started_at = None
+        self.deadline = None
+        self.task = None
+
+    def start(self, timeout):
+        self.draining = True
+        self.started_at = time.time()
+        self.deadline = self.started_at + timeout
+
+    def seconds_remaining(self):
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.time(), 0.0)
+
+drain_state = DrainState()
+
+def find_own_listener_pid(port):
+    """Return the PID of this process or its parent (the uvicorn supervisor) if it listens on the port.
+
+    Only those two processes' sockets are inspected, so no other process on the
+    host is scanned and no extra privileges are needed.
+    """
+    for pid in (os.getpid(), os.getppid()):
+        try:
+            connections = psutil.Process(pid).connections(kind="tcp")
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        for conn in connections:
+            if conn.status == psutil.CONN_LISTEN and conn.laddr and conn.laddr.port == port:
+                return pid
+    return None
+
+async def notify_sessions(active_connections, message):
+    """Send a message to every active session through its own send path."""
+    for connection_id, connection in list(active_connections.items()):
+        send_message = connection.get("send_message")
+        if send_message is None:
+            continue
+        try:
+            await send_message(message)
+        except Exception as e:
+            logger.warning(f"Could not notify session {connection_id}: {e}")
+
+async def drain(active_connections, timeout=DRAIN_TIMEOUT, exit_when_done=True):
+    """Stop accepting sessions, let active ones finish until the deadline, then stop the rest and exit."""
+    if not drain_state.draining:
+        drain_state.start(timeout)
+    logger.info(f"Draining: {len(active_connections)} active session(s), deadline in {drain_state.seconds_remaining():.0f}s")
+
+    # Tell clients so they can wrap up the current utterance or reconnect elsewhere
+    await notify_sessions(active_connections, {
+        "status": "DRAINING",
+        "message": "Server is restarting; the current session will end soon",
+        "deadline": drain_state.deadline,
+        "seconds_remaining": drain_state.seconds_remaining()
+    })
+
+    while active_connections and time.time() < drain_state.deadline:
+        await asyncio.sleep(DRAIN_POLL_INTERVAL)
+
+    if active_connections:
+        logger.warning(f"Drain deadline reached; stopping {len(active_connections)} remaining session(s)")
+        for connection in list(active_connections.values()):
+            connection["stop_event"].set()
+        # Give the handlers a moment to flush transcripts and close their sockets
+        await asyncio.sleep(2.0)
+    else:
+        logger.info("All sessions finished")
+
+    if exit_when_done:
+        # SIGTERM lets uvicorn run its normal graceful shutdown
+        logger.info("Drain complete, shutting down")
+        os.kill(os.getpid(), signal.SIGTERM)
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import time
+
+# Minimum time between interim translation updates shown to the listener (seconds)
+INTERIM_MIN_INTERVAL = float(os.environ.get("INTERIM_MIN_INTERVAL", 0.5))
+
+# Weight of the newest sample in the moving average of translate latency
+LATENCY_SMOOTHING = float(os.environ.get("INTERIM_LATENCY_SMOOTHING", 0.3))
+
+# Latency assumed before the first translation of a session has been measured (seconds)
+INITIAL_LATENCY = 0.2
+
+class InterimTranslationThrottle:
+    """Budgets interim translations for one session by measured translate latency.
+
+    At most one translation is in flight (the consumer awaits each one before
+    asking for the next), a newer interim transcript replaces any queued one,
+    and translations start no more often than the larger of the minimum display
+    interval and the average translate latency. ``cancel`` is called when a
+    FINAL result arrives so queued and in-flight interim work is dropped; it
+    also resets the interval, so the first interim of the next utterance is
+    translated immediately.
+    """
+
+    def __init__(self, min_interval=INTERIM_MIN_INTERVAL, smoothing=LATENCY_SMOOTHING):
+        self.min_interval = min_interval
+        self.smoothing = smoothing
+        self.latency = INITIAL_LATENCY
+        self.generation = 0
+        self.last_started = float("-inf")
+        self.last_submitted = ""
+        self.pending = None
+        self._ready = asyncio.Event()
+        self._reset = asyncio.Event()
+
+    def interval(self):
+        return max(self.min_interval, self.latency)
+
+    def submit(self, transcript):
+        """Queue an interim transcript for translation, replacing anything already queued."""
+        text = transcript.strip()
+        if not text or text == self.last_submitted:
+            return
+        self.last_submitted = text
+        self.pending = text
+        self._ready.set()
+
+    def cancel(self):
+        """Drop queued work and invalidate any translation still in flight."""
+        self.generation += 1
+        self.pending = None
+        self.last_submitted = ""
+        self.last_started = float("-inf")
+        self._ready.clear()
+        # Wake a consumer that is waiting out the previous utterance's interval
+        self._reset.set()
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def record_latency(self, seconds):
+        self.latency = (1 - self.smoothing) * self.latency + self.smoothing * seconds
+
+    async def next(self):
+        """Wait until a queued transcript may be translated; returns (text, generation)."""
+        while True:
+            await self._ready.wait()
+            delay = self.last_started + self.interval() - time.monotonic()
+            if delay > 0:
+                self._reset.clear()
+                try:
+                    await asyncio.wait_for(self._reset.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if self.pending is None:
+                self._ready.clear()
+                continue
+            text, self.pending = self.pending, None
+            self._ready.clear()
+            self.last_started = time.monotonic()
+            return text, self.generation
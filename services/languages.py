@@ -0,0 +1,8 @@
+def language_key(language):
+    """Reduce a language-country code to its base language code (e.g. "es-ES" -> "es").
+
+    Translation, transcript storage, the translation memory and session
+    language de-duplication all key on this, so they agree on what counts as
+    the same language.
+    """
+    return (language or "").split('-')[0]
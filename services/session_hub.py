@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import uuid
+
+from services.languages import language_key
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Messages buffered per listener before a listener that cannot keep up is dropped
+LISTENER_QUEUE_SIZE = 100
+
+# Longest a single send to a listener may take before the listener is dropped (seconds)
+LISTENER_SEND_TIMEOUT = 5.0
+
+def localize(message, language, include_all=False):
+    """Project a fan-out message onto one language.
+
+    Messages produced by the recognition pipeline carry a ``translations`` dict
+    keyed by language; clients expect a single ``translation`` field. With
+    ``include_all`` the full dict is kept as well (used for multi-language speakers).
+    """
+    translations = message.get("translations")
+    if translations is None:
+        return message
+
+    result = {key: value for key, value in message.items() if key != "translations"}
+    translation = translations.get(language)
+    if translation is not None:
+        result["translation"] = translation
+    elif message.get("is_final") and message.get("status") == "FINAL":
+        result["error"] = "Translation temporarily unavailable"
+    if include_all:
+        result["translations"] = translations
+    return result
+
+class SpeakerSession:
+    """One speaker's recognition session and the listener WebSockets subscribed to it.
+
+    ``languages`` is the list the recognition pipeline translates into; it is
+    shared by reference, so a language a listener asks for is picked up from
+    the next result on, and dropped again when its last listener leaves.
+    Each listener has its own bounded queue and sender task, so a slow
+    listener socket never holds up the speaker or the recognition loop.
+    """
+
+    def __init__(self, session_id, languages):
+        self.session_id = session_id
+        self.languages = languages
+        self.speaker_languages = set(languages)
+        self.language_refs = {}  # language -> number of listeners that added it
+        self.listeners = {}      # listener_id -> (language, queue, task)
+        self.closed = asyncio.Event()
+
+    def resolve_language(self, language):
+        """Return the session's existing code for the same base language, or the language itself."""
+        for existing in self.languages:
+            if language_key(existing) == language_key(language):
+                return existing
+        return language
+
+    def add_listener(self, language, sender):
+        """Subscribe a sender; returns (listener_id, language the listener will receive)."""
+        language = self.resolve_language(language)
+        listener_id = str(uuid.uuid4())
+        messages = asyncio.Queue(maxsize=LISTENER_QUEUE_SIZE)
+        task = asyncio.create_task(self._forward(listener_id, language, messages, sender))
+        self.listeners[listener_id] = (language, messages, task)
+
+        if language not in self.speaker_languages:
+            self.language_refs[language] = self.language_refs.get(language, 0) + 1
+            if language not in self.languages:
+                self.languages.append(language)
+                logger.info(f"Session {self.session_id} now translating into {self.languages}")
+        return listener_id, language
+
+    def remove_listener(self, listener_id):
+        listener = self.listeners.pop(listener_id, None)
+        if listener is None:
+            return
+        language, _, task = listener
+        if task is not asyncio.current_task():
+            task.cancel()
+
+        # Stop translating into a language once nobody is listening to it
+        if language in self.language_refs:
+            self.language_refs[language] -= 1
+            if self.language_refs[language] <= 0:
+                del self.language_refs[language]
+                if language in self.languages:
+                    self.languages.remove(language)
+                logger.info(f"Session {self.session_id} now translating into {self.languages}")
+
+    async def _forward(self, listener_id, language, messages, sender):
+        while True:
+            message = await messages.get()
+            try:
+                await asyncio.wait_for(sender.send(localize(message, language)), LISTENER_SEND_TIMEOUT)
+            except Exception as e:
+                logger.info(f"Dropping listener {listener_id} of session {self.session_id}: {e!r}")
+                self.remove_listener(listener_id)
+                return
+            finally:
+                messages.task_done()
+
+    async def publish(self, message):
+        """Queue a message for every listener, dropping listeners that have fallen too far behind."""
+        for listener_id, (_, messages, _) in list(self.listeners.items()):
+            try:
+                messages.put_nowait(message)
+            except asyncio.QueueFull:
+                logger.info(f"Dropping listener {listener_id} of session {self.session_id}: too far behind")
+                self.remove_listener(listener_id)
+
+    async def close(self):
+        await self.publish({"status": "COMPLETE", "is_final": True})
+        # Give listeners a bounded amount of time to receive what is still queued
+        pending = [messages.join() for _, messages, _ in self.listeners.values()]
+        if pending:
+            try:
+                await asyncio.wait_for(asyncio.gather(*pending), LISTENER_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        self.closed.set()
+
+# Active speaker sessions by connection ID
+speaker_sessions = {}
@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+import queue
+import re
+import struct
+import threading
+import time
+
+from services.languages import language_key
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Session logs hold patient conversations, so keep them outside the publicly served STATIC_DIR
+TRANSCRIPT_STORE_DIR = os.environ.get("TRANSCRIPT_STORE_DIR", "/tmp/transcript_store")
+
+# Batched flushes to Google Cloud Storage: upload after this many segments or seconds, whichever comes first
+FLUSH_BATCH_SEGMENTS = int(os.environ.get("TRANSCRIPT_FLUSH_SEGMENTS", 20))
+FLUSH_INTERVAL = float(os.environ.get("TRANSCRIPT_FLUSH_INTERVAL", 10.0))
+
+# Fixed-size index record: log offset, record length, timestamp, language code
+INDEX_RECORD = struct.Struct("<QId8s")
+
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# Object written after a session's last chunk; a copy restored before it exists may still grow
+END_MARKER = "end"
+
+class TranscriptStore:
+    """Append-only, per-session transcript log with a fixed-width index.
+
+    Each session has a ``<session_id>.log`` file of JSON lines and a
+    ``<session_id>.idx`` file with one record per segment (offset, length,
+    timestamp, language). Lookups scan the small index and then read only the
+    matching segments from the log. When a bucket is given, new segments are
+    uploaded in batches as chunk objects by a background thread, followed by an
+    end marker when the session closes. A session restored from the bucket is
+    re-fetched (only the new chunks) until its end marker is present.
+    """
+
+    def __init__(self, root, bucket=None):
+        self.root = root
+        self.bucket = bucket
+        self._lock = threading.Lock()
+        self._pending = {}  # session_id -> [first_seq, [lines], first_append_time]
+        self._counts = {}   # session_id -> number of segments in the log
+        self._writing = set()  # sessions appended to by this process; their local copy is current
+        self._uploads = queue.Queue()
+        os.makedirs(root, exist_ok=True)
+
+        if bucket is not None:
+            threading.Thread(target=self._upload_worker, daemon=True).start()
+
+    def _paths(self, session_id):
+        if not SESSION_ID_PATTERN.fullmatch(session_id or ""):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        base = os.path.join(self.root, session_id)
+        return f"{base}.log", f"{base}.idx"
+
+    def _end_path(self, session_id):
+        return os.path.join(self.root, f"{session_id}.end")
+
+    def _segment_count(self, session_id, index_path):
+        if session_id not in self._counts:
+            size = os.path.getsize(index_path) if os.path.exists(index_path) else 0
+            self._counts[session_id] = size // INDEX_RECORD.size
+        return self._counts[session_id]
+
+    def _write(self, session_id, original, translation, language, timestamp):
+        # Caller holds self._lock
+        log_path, index_path = self._paths(session_id)
+        seq = self._segment_count(session_id, index_path)
+        line = (json.dumps({
+            "seq": seq,
+            "timestamp": timestamp,
+            "language": language,
+            "original": original,
+            "translation": translation,
+        }, ensure_ascii=False) + "\n").encode("utf-8")
+
+        with open(log_path, "ab") as log_file:
+            offset = log_file.tell()
+            log_file.write(line)
+        with open(index_path, "ab") as index_file:
+            index_file.write(INDEX_RECORD.pack(offset, len(line), timestamp, language.encode("ascii", "ignore")[:8]))
+        self._counts[session_id] = seq + 1
+        return seq, line
+
+    def append(self, session_id, original, translation, language, timestamp=None):
+        """Append a FINAL segment to the session log and return its sequence number."""
+        timestamp = time.time() if timestamp is None else timestamp
+
+        with self._lock:
+            seq, line = self._write(session_id, original, translation, language_key(language), timestamp)
+            self._writing.add(session_id)
+
+            if self.bucket is not None:
+                pending = self._pending.setdefault(session_id, [seq, [], time.monotonic()])
+                pending[1].append(line)
+                if len(pending[1]) >= FLUSH_BATCH_SEGMENTS or time.monotonic() - pending[2] >= FLUSH_INTERVAL:
+                    self._queue_flush(session_id)
+
+        return seq
+
+    def _index_entries(self, index_path):
+        with open(index_path, "rb") as index_file:
+            data = index_file.read()
+        for offset, length, timestamp, language in INDEX_RECORD.iter_unpack(data[:len(data) - len(data) % INDEX_RECORD.size]):
+            yield offset, length, timestamp, language.rstrip(b"\0").decode("ascii")
+
+    def segments(self, session_id, language=None, start=None, end=None):
+        """Return the session's segments, optionally filtered by language and timestamp range."""
+        log_path, index_path = self._paths(session_id)
+        # Another instance may still be adding to the session until its end marker is uploaded
+        if self.bucket is not None and session_id not in self._writing and not os.path.exists(self._end_path(session_id)):
+            self._restore_from_bucket(session_id)
+        if not os.path.exists(index_path):
+            return []
+
+        language = language_key(language) if language else None
+        wanted = [
+            (offset, length)
+            for offset, length, timestamp, segment_language in self._index_entries(index_path)
+            if (language is None or segment_language == language)
+            and (start is None or timestamp >= start)
+            and (end is None or timestamp <= end)
+        ]
+
+        results = []
+        with open(log_path, "rb") as log_file:
+            for offset, length in wanted:
+                log_file.seek(offset)
+                results.append(json.loads(log_file.read(length)))
+        return results
+
+    def text(self, session_id, language=None):
+        """Concatenate the translated text of the session's segments.
+
+        Raises ValueError when no language is given and the session has
+        translations in more than one, since mixing them makes no sense as one text.
+        """
+        segments = self.segments(session_id, language)
+        if language is None:
+            languages = sorted({segment["language"] for segment in segments})
+            if len(languages) > 1:
+                raise ValueError(f"Session {session_id} has translations in {', '.join(languages)}; a language is required")
+        return " ".join(segment["translation"] for segment in segments if segment["translation"]).strip()
+
+    def close(self, session_id):
+        """Flush any segments of the session that have not been uploaded yet and mark it complete."""
+        with self._lock:
+            if session_id not in self._writing:
+                return
+            if session_id in self._pending:
+                self._queue_flush(session_id)
+            if self.bucket is not None:
+                # Queued after the last chunk, and the single upload worker keeps the order
+                self._uploads.put((f"transcripts/sessions/{session_id}/{END_MARKER}", b""))
+            open(self._end_path(session_id), "wb").close()
+            self._writing.discard(session_id)
+
+    def _queue_flush(self, session_id):
+        # Caller holds self._lock
+        first_seq, lines, _ = self._pending.pop(session_id)
+        last_seq = first_seq + len(lines) - 1
+        blob_name = f"transcripts/sessions/{session_id}/{first_seq:08d}-{last_seq:08d}.jsonl"
+        self._uploads.put((blob_name, b"".join(lines)))
+
+    def _flush_expired(self):
+        """Queue uploads for sessions whose oldest pending segment has waited FLUSH_INTERVAL."""
+        now = time.monotonic()
+        with self._lock:
+            for session_id in [sid for sid, pending in self._pending.items() if now - pending[2] >= FLUSH_INTERVAL]:
+                self._queue_flush(session_id)
+
+    def _upload_worker(self):
+        while True:
+            # Wake up at least every FLUSH_INTERVAL so a session that went quiet still gets uploaded
+            try:
+                blob_name, data = self._uploads.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                self._flush_expired()
+                continue
+
+            try:
+                self.bucket.blob(blob_name).upload_from_string(data, content_type="application/x-ndjson")
+            except Exception as e:
+                logger.error(f"Error uploading transcript chunk {blob_name}: {e}")
+            self._flush_expired()
+
+    def _restore_from_bucket(self, session_id):
+        """Bring the local log and index up to date from uploaded chunks (e.g. on another instance)."""
+        prefix = f"transcripts/sessions/{session_id}/"
+        try:
+            blobs = sorted(self.bucket.list_blobs(prefix=prefix), key=lambda b: b.name)
+            with self._lock:
+                _, index_path = self._paths(session_id)
+                complete = False
+                for blob in blobs:
+                    name = blob.name[len(prefix):]
+                    if name == END_MARKER:
+                        complete = True
+                        continue
+                    # Chunks are named <first_seq>-<last_seq>.jsonl; skip the ones already restored
+                    last_seq = int(name.split(".")[0].split("-")[1])
+                    if last_seq < self._segment_count(session_id, index_path):
+                        continue
+                    # Restored segments are already in the bucket, so they are written without queuing an upload
+                    for line in blob.download_as_bytes().decode("utf-8").splitlines():
+                        segment = json.loads(line)
+                        if segment["seq"] < self._segment_count(session_id, index_path):
+                            continue
+                        self._write(session_id, segment["original"], segment["translation"], segment["language"], segment["timestamp"])
+                if complete:
+                    open(self._end_path(session_id), "wb").close()
+        except Exception as e:
+            logger.warning(f"Could not restore transcript session {session_id} from Google Cloud Storage: {e}")
+
+# Shared store, uploading to Google Cloud Storage when a bucket is configured
+_bucket = None
+if os.environ.get("GCS_BUCKET_NAME"):
+    try:
+        from google.cloud import storage
+        _bucket = storage.Client().bucket(os.environ["GCS_BUCKET_NAME"])
+    except Exception as e:
+        logger.error(f"Error initializing Google Cloud Storage for transcripts: {e}")
+
+transcript_store = TranscriptStore(TRANSCRIPT_STORE_DIR, _bucket)
@@ -0,0 +1,207 @@
+import difflib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from services.languages import language_key
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Location of the on-disk index. Keep it outside STATIC_DIR so it is never served publicly.
+# Set TRANSLATION_MEMORY_PATH to an empty string to disable the translation memory entirely.
+TRANSLATION_MEMORY_PATH = os.environ.get("TRANSLATION_MEMORY_PATH", "/tmp/translation_memory.db")
+
+# Workers that should only read the shared index (e.g. a pre-built, clinician-approved file)
+TRANSLATION_MEMORY_READ_ONLY = os.environ.get("TRANSLATION_MEMORY_READ_ONLY", "").lower() in ("1", "true", "yes")
+
+# Minimum normalized-token similarity for an approved near-match to be offered as a suggestion
+TRANSLATION_MEMORY_MIN_SIMILARITY = float(os.environ.get("TRANSLATION_MEMORY_MIN_SIMILARITY", 0.8))
+
+# Size of the memory map used by reader connections (bytes)
+TRANSLATION_MEMORY_MMAP_SIZE = int(os.environ.get("TRANSLATION_MEMORY_MMAP_SIZE", 256 * 1024 * 1024))
+
+# Number of full-text candidates re-ranked by token similarity for each near-match lookup
+NEAR_MATCH_CANDIDATES = 20
+
+# Maximum number of near-match suggestions returned for one text
+MAX_SUGGESTIONS = 3
+
+# Bumped when the meaning of the stored keys changes; older files are re-keyed on open
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    target_language TEXT NOT NULL,
+    source_norm TEXT NOT NULL,
+    source_text TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    approved INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    UNIQUE (target_language, source_norm)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    source_norm, content='entries', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts(rowid, source_norm) VALUES (new.id, new.source_norm);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts(entries_fts, rowid, source_norm) VALUES ('delete', old.id, old.source_norm);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE ON entries BEGIN
+    INSERT INTO entries_fts(entries_fts, rowid, source_norm) VALUES ('delete', old.id, old.source_norm);
+    INSERT INTO entries_fts(rowid, source_norm) VALUES (new.id, new.source_norm);
+END;
+"""
+
+def normalize_tokens(text):
+    """Lowercase the text and split it into word tokens, dropping punctuation (used for suggestions)."""
+    return re.findall(r"\w+", text.lower())
+
+def exact_key(text):
+    """Key for exact matches: casefolded with whitespace collapsed, punctuation kept.
+
+    "No, pain." and "No pain." mean different things and must not share a translation.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).casefold().split())
+
+class TranslationMemory:
+    """Persistent translation memory backed by a SQLite FTS5 index.
+
+    Only exact matches on the normalized text are served as translations.
+    Near-matches are never substituted: a changed dose or a dropped "not" is a
+    single token of difference, so they are only offered as suggestions, and
+    only from clinician-approved entries.
+    """
+
+    def __init__(self, path, read_only=False, min_similarity=TRANSLATION_MEMORY_MIN_SIMILARITY):
+        self.path = path
+        self.read_only = read_only
+        self.min_similarity = min_similarity
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writer = None
+
+        if not read_only:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._writer = sqlite3.connect(path, check_same_thread=False)
+            # WAL lets every worker keep reading while one of them writes
+            self._writer.execute("PRAGMA journal_mode=WAL")
+            self._writer.executescript(SCHEMA)
+            self._migrate()
+            self._writer.commit()
+
+    def _migrate(self):
+        """Re-key entries stored before exact matches kept punctuation (schema version 0)."""
+        if self._writer.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        rows = self._writer.execute("SELECT id, source_text FROM entries").fetchall()
+        for entry_id, source_text in rows:
+            self._writer.execute("UPDATE entries SET source_norm = ? WHERE id = ?", (exact_key(source_text), entry_id))
+        self._writer.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _reader(self):
+        """Return this thread's read-only connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size={TRANSLATION_MEMORY_MMAP_SIZE}")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, text, target_language):
+        """Return the stored translation of exactly this text (case and spacing aside), or None."""
+        key = exact_key(text)
+        if not key:
+            return None
+
+        try:
+            row = self._reader().execute(
+                "SELECT translation FROM entries WHERE target_language = ? AND source_norm = ?",
+                (language_key(target_language), key)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Translation memory lookup failed: {e}")
+            return None
+        return row[0] if row else None
+
+    def suggestions(self, text, target_language, limit=MAX_SUGGESTIONS):
+        """Return approved translations of similar texts, best first, for a human to review.
+
+        These are translations of *different* source sentences and must never be
+        used in place of a translation of the text itself.
+        """
+        tokens = normalize_tokens(text)
+        if not tokens:
+            return []
+
+        language = language_key(target_language)
+
+        try:
+            # Let FTS narrow the candidates, then rank by token similarity
+            match_query = " OR ".join(f'"{token}"' for token in set(tokens))
+            candidates = self._reader().execute(
+                "SELECT e.source_norm, e.source_text, e.translation FROM entries_fts "
+                "JOIN entries e ON e.id = entries_fts.rowid "
+                "WHERE entries_fts MATCH ? AND e.target_language = ? AND e.approved = 1 "
+                "AND e.source_norm != ? "
+                "ORDER BY bm25(entries_fts) LIMIT ?",
+                (match_query, language, exact_key(text), NEAR_MATCH_CANDIDATES)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Translation memory suggestion lookup failed: {e}")
+            return []
+
+        results = []
+        for candidate_norm, source_text, translation in candidates:
+            score = difflib.SequenceMatcher(None, tokens, normalize_tokens(candidate_norm)).ratio()
+            if score >= self.min_similarity:
+                results.append({
+                    "source_text": source_text,
+                    "translation": translation,
+                    "similarity": round(score, 2)
+                })
+        results.sort(key=lambda suggestion: suggestion["similarity"], reverse=True)
+        return results[:limit]
+
+    def record(self, text, target_language, translation, approved=False):
+        """Store a translation. Machine translations never overwrite approved entries."""
+        if self.read_only or not translation:
+            return False
+
+        key = exact_key(text)
+        if not key:
+            return False
+
+        try:
+            with self._write_lock:
+                self._writer.execute(
+                    "INSERT INTO entries (target_language, source_norm, source_text, translation, approved, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (target_language, source_norm) DO UPDATE SET "
+                    "source_text = excluded.source_text, translation = excluded.translation, "
+                    "approved = excluded.approved, updated_at = excluded.updated_at "
+                    "WHERE entries.approved = 0 OR excluded.approved = 1",
+                    (language_key(target_language), key, text, translation, int(approved), time.time())
+                )
+                self._writer.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"Translation memory write failed: {e}")
+            return False
+
+# Shared instance used by the translate paths (None when disabled or unavailable)
+translation_memory = None
+if TRANSLATION_MEMORY_PATH:
+    try:
+        translation_memory = TranslationMemory(TRANSLATION_MEMORY_PATH, read_only=TRANSLATION_MEMORY_READ_ONLY)
+        logger.info(f"Translation memory loaded from {TRANSLATION_MEMORY_PATH}")
+    except Exception as e:
+        logger.error(f"Error initializing translation memory: {e}")
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+# msgpack is optional - without it clients are kept on the plain JSON protocol
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Protocol names exchanged during connection negotiation
+PROTOCOL_JSON = "json"
+PROTOCOL_DELTA = "delta-msgpack"
+
+# Default maximum number of interim updates per second sent on the delta protocol
+INTERIM_MAX_RATE = float(os.environ.get("INTERIM_MAX_RATE", 5))
+
+# Text fields that are sent as [replace_from_offset, new_text] deltas
+DELTA_FIELDS = {"original": "o", "translation": "t"}
+
+# Other fields that get a short key on the wire
+SHORT_KEYS = {"status": "s", "is_final": "f"}
+
+def negotiate_protocol(requested):
+    """Pick the protocol for a connection based on what the client asked for."""
+    if requested in ("delta", PROTOCOL_DELTA):
+        if msgpack is not None:
+            return PROTOCOL_DELTA
+        logger.warning("Delta protocol requested but msgpack is not installed; using JSON")
+    return PROTOCOL_JSON
+
+def utf16_length(text):
+    """Length of the text in UTF-16 code units, which is how the browser indexes strings."""
+    return len(text.encode("utf-16-le")) // 2
+
+def text_delta(previous, current):
+    """Return [offset, new_text] such that previous[:offset] + new_text == current."""
+    prefix = 0
+    limit = min(len(previous), len(current))
+    while prefix < limit and previous[prefix] == current[prefix]:
+        prefix += 1
+    return [utf16_length(current[:prefix]), current[prefix:]]
+
+class DeltaEncoder:
+    """Encodes outgoing messages as msgpack frames carrying only text deltas.
+
+    Each text field is diffed against the last value sent for that field on this
+    connection, so interim updates cost bytes proportional to what changed.
+    """
+
+    def __init__(self):
+        self.last_sent = {field: "" for field in DELTA_FIELDS}
+
+    def encode(self, message):
+        frame = {}
+        for key, value in message.items():
+            if key in DELTA_FIELDS:
+                # Always send the field when present (an empty delta still means "this field is set")
+                frame[DELTA_FIELDS[key]] = text_delta(self.last_sent[key], value)
+                self.last_sent[key] = value
+            else:
+                frame[SHORT_KEYS.get(key, key)] = value
+        return msgpack.packb(frame, use_bin_type=True)
+
+class InterimCoalescer:
+    """Limits interim updates to a maximum rate by merging them until the next send slot."""
+
+    def __init__(self, max_rate=INTERIM_MAX_RATE):
+        self.min_interval = 1.0 / max_rate if max_rate and max_rate > 0 else 0.0
+        self.last_send_time = 0.0
+        self.pending = None
+
+    def offer(self, message, now=None):
+        """Return the message to send now, or None if it was held back for coalescing."""
+        now = time.monotonic() if now is None else now
+
+        # Anything that is not an interim update ends the current utterance; drop what was held
+        if message.get("status") != "INTERIM":
+            self.pending = None
+            return message
+
+        # Merge so a held translation is not lost when a newer transcript-only update arrives
+        if self.pending:
+            self.pending.update(message)
+        else:
+            self.pending = dict(message)
+
+        if now - self.last_send_time < self.min_interval:
+            return None
+
+        return self.take(now)
+
+    def next_send_time(self):
+        """Time at which a held update may go out (trailing edge of the current window)."""
+        return self.last_send_time + self.min_interval
+
+    def take(self, now=None):
+        """Release the held update, if any, and start a new rate window."""
+        if self.pending is None:
+            return None
+        self.last_send_time = time.monotonic() if now is None else now
+        message, self.pending = self.pending, None
+        return message
+
+class MessageSender:
+    """Serializes messages for one WebSocket according to the negotiated protocol.
+
+    On the delta protocol an interim update held back by the coalescer is sent
+    by a timer at the end of its rate window, so the last update before a pause
+    is never stuck waiting for the next message.
+    """
+
+    def __init__(self, websocket, protocol=PROTOCOL_JSON, max_rate=INTERIM_MAX_RATE):
+        self.websocket = websocket
+        self.protocol = protocol
+        self.encoder = DeltaEncoder() if protocol == PROTOCOL_DELTA else None
+        self.coalescer = InterimCoalescer(max_rate) if protocol == PROTOCOL_DELTA else None
+        # Frames must go out in the order they were delta-encoded
+        self._lock = asyncio.Lock()
+        self._flush_task = None
+
+    async def send(self, message):
+        if self.encoder is None:
+            await self.websocket.send_text(json.dumps(message))
+            return
+
+        async with self._lock:
+            message = self.coalescer.offer(message)
+            if message is not None:
+                self._cancel_flush()
+                await self.websocket.send_bytes(self.encoder.encode(message))
+            elif self._flush_task is None or self._flush_task.done():
+                self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        """Send the held interim update once its rate window has passed."""
+        try:
+            await asyncio.sleep(max(self.coalescer.next_send_time() - time.monotonic(), 0.0))
+            async with self._lock:
+                message = self.coalescer.take()
+                if message is not None:
+                    await self.websocket.send_bytes(self.encoder.encode(message))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.debug(f"Could not flush held interim update: {e}")
+
+    def _cancel_flush(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        self._flush_task = None
+
+    def close(self):
+        """Stop the pending flush timer; call when the WebSocket is going away."""
+        self._cancel_flush()
@@ -0,0 +1,49 @@
+import wave
+
+import pytest
+
+pytest.importorskip("pyaudio")
+
+from services.audio_recorder import CHUNK, RATE, record_audio, record_from_stream
+
+
+class FakeStream:
+    """Stands in for a PyAudio input stream, returning numbered 16-bit mono chunks."""
+
+    def __init__(self):
+        self.chunks_read = 0
+
+    def read(self, frames):
+        self.chunks_read += 1
+        return (self.chunks_read % 256).to_bytes(1, "little") * (frames * 2)
+
+
+def recorded_frames(path):
+    with wave.open(str(path), "rb") as wav_file:
+        return wav_file.getnframes(), wav_file.readframes(wav_file.getnframes())
+
+
+@pytest.mark.parametrize("window_seconds", [64, 65])
+def test_window_keeps_full_window_when_capacity_is_chunk_multiple(tmp_path, window_seconds):
+    # 64 s at 16 kHz is exactly 1000 chunks of CHUNK frames, so no single write straddles the end
+    output_path = tmp_path / "window.wav"
+    record_from_stream(FakeStream(), str(output_path), duration=200, window_seconds=window_seconds)
+
+    frames, data = recorded_frames(output_path)
+    assert frames == window_seconds * RATE
+    # The last chunk recorded is the last one in the file
+    total_chunks = int(RATE / CHUNK * 200)
+    assert data[-1] == total_chunks % 256
+
+
+def test_without_window_every_chunk_is_written(tmp_path):
+    output_path = tmp_path / "full.wav"
+    record_from_stream(FakeStream(), str(output_path), duration=2)
+
+    frames, _ = recorded_frames(output_path)
+    assert frames == int(RATE / CHUNK * 2) * CHUNK
+
+
+def test_record_audio_requires_a_way_to_stop():
+    with pytest.raises(ValueError):
+        record_audio()